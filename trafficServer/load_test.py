@@ -0,0 +1,211 @@
+# Reto - Movilidad Urbana
+# Modelación de Sistemas Multiagentes con Gráficas Computacionales
+# 28/11/2024
+# Francisco José Urquizo Schnaas A01028786
+# Gabriel Edid Harari A01782146
+# load_test.py
+#
+# Generador de carga para traffic_server.py. Simula varios clientes WebGL con el mismo patrón
+# de llamadas que visualization/traffic_agents.js: /init y después un ciclo de /update seguido
+# de /getAgents y /getTrafficLights. Reporta throughput y latencias p50/p95/p99 por endpoint
+# para cada combinación de número de clientes y densidad de coches. La densidad se controla con
+# spawnEvery de /init (cada cuántos pasos se crean coches): con el valor por defecto, 10, la ciudad
+# se estabiliza en ~20 coches; con 3 en ~65 y con 2 en ~100. Con 1 la ciudad termina en bloqueo total.
+#
+# Ejemplo:
+#   python load_test.py --clients 1 4 16 --spawn-every 10 3 2 --duration 10
+#   python load_test.py --server sharded_server.py --sessions --clients 1 4 16
+
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import subprocess
+import http.client
+from concurrent.futures import ThreadPoolExecutor
+
+FRAME_ENDPOINTS = ['getAgents', 'getTrafficLights']
+STATIC_ENDPOINTS = ['getObstacles', 'getDestinations', 'getRoads']
+
+
+def percentile(sorted_values, p):
+    """Retorna el percentil p (0-100) de una lista ordenada, por rango más cercano."""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(p / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+class Client:
+    """Cliente HTTP con conexión persistente que registra la latencia de cada llamada."""
+
+    def __init__(self, host, port, timeout, session=None):
+        self.connection = http.client.HTTPConnection(host, port, timeout=timeout)
+        self.session = session  # Sesión propia del cliente (sharded_server.py), o None
+        self.latencies = {}  # Endpoint -> lista de latencias en segundos
+        self.errors = {}  # Endpoint -> número de respuestas con error
+        self.cars = []  # Número de coches visto en cada /getAgents
+
+    def call(self, method, endpoint, body=None):
+        """Hace una llamada, registra su latencia y retorna el JSON de la respuesta (o None)."""
+        payload = json.dumps(body) if body is not None else None
+        headers = {'Content-Type': 'application/json'} if payload is not None else {}
+        if self.session:
+            headers['X-Session-Id'] = self.session
+        start = time.perf_counter()
+        try:
+            self.connection.request(method, '/' + endpoint, body=payload, headers=headers)
+            response = self.connection.getresponse()
+            data = response.read()
+            ok = response.status == 200
+        except (OSError, http.client.HTTPException):
+            self.connection.close()
+            data, ok = None, False
+        self.latencies.setdefault(endpoint, []).append(time.perf_counter() - start)
+        if not ok:
+            self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+            return None
+        return json.loads(data)
+
+    def frame(self, static):
+        """Un ciclo del visualizador: avanzar un paso y pedir el estado de los agentes."""
+        if self.call('POST', 'update', {'steps': 1}) is None:
+            return
+        for endpoint in FRAME_ENDPOINTS + (STATIC_ENDPOINTS if static else []):
+            result = self.call('GET', endpoint)
+            if endpoint == 'getAgents' and result is not None:
+                self.cars.append(len(result['positions']))
+
+
+def run_scenario(host, port, clients, spawn_every, warmup, duration, static, timeout, sessions=False):
+    """
+    Ejecuta un escenario: todos los clientes hacen /init con spawnEvery, el modelo se adelanta
+    warmup pasos hasta estabilizar el número de coches y después cada cliente repite frames
+    durante duration segundos.
+    Con sessions cada cliente usa su propia sesión (y su propio modelo) en lugar del modelo global.
+
+    Returns:
+        dict: Resultados agregados por endpoint.
+    """
+    pool = [Client(host, port, timeout, f"load-{i}" if sessions else None) for i in range(clients)]
+    warmed = pool if sessions else pool[:1]
+    with ThreadPoolExecutor(max_workers=clients) as executor:
+        list(executor.map(lambda client: client.call(
+            'POST', 'init', {'NAgents': 10, 'spawnEvery': spawn_every}), pool))
+        if warmup:
+            list(executor.map(lambda client: client.call(
+                'POST', 'update', {'steps': warmup, 'fastForward': True, 'collectEvery': warmup}), warmed))
+
+        deadline = time.perf_counter() + duration
+        def loop(client):
+            while time.perf_counter() < deadline:
+                client.frame(static)
+
+        start = time.perf_counter()
+        list(executor.map(loop, pool))
+        elapsed = time.perf_counter() - start
+
+    endpoints = {}
+    for client in pool:
+        for endpoint, latencies in client.latencies.items():
+            endpoints.setdefault(endpoint, []).extend(latencies)
+    cars = [count for client in pool for count in client.cars]
+    results = {}
+    for endpoint, latencies in endpoints.items():
+        latencies.sort()
+        results[endpoint] = {
+            'requests': len(latencies),
+            'errors': sum(client.errors.get(endpoint, 0) for client in pool),
+            'throughput': 0.0 if endpoint == 'init' else len(latencies) / elapsed,
+            'p50': percentile(latencies, 50) * 1000,
+            'p95': percentile(latencies, 95) * 1000,
+            'p99': percentile(latencies, 99) * 1000,
+        }
+    return {
+        'clients': clients,
+        'spawnEvery': spawn_every,
+        'warmup': warmup,
+        'cars': sum(cars) / len(cars) if cars else 0,
+        'frames': len(endpoints.get('update', [])) - (len(warmed) if warmup else 0),
+        'elapsed': elapsed,
+        'endpoints': results,
+    }
+
+
+def print_scenario(result):
+    """Imprime los resultados de un escenario como tabla."""
+    print(f"\nClientes: {result['clients']}  spawnEvery: {result['spawnEvery']}  "
+          f"Pasos de calentamiento: {result['warmup']}  "
+          f"Coches promedio: {result['cars']:.1f}  Frames/s: {result['frames'] / result['elapsed']:.1f}")
+    print(f"  {'endpoint':<18}{'req':>8}{'err':>6}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for endpoint, stats in result['endpoints'].items():
+        print(f"  {endpoint:<18}{stats['requests']:>8}{stats['errors']:>6}{stats['throughput']:>10.1f}"
+              f"{stats['p50']:>10.2f}{stats['p95']:>10.2f}{stats['p99']:>10.2f}")
+
+
+def wait_for_port(host, port, timeout):
+    """Espera a que el servidor acepte conexiones; retorna False si se agota el tiempo."""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection((host, port), timeout=0.5):
+                return True
+        except OSError:
+            time.sleep(0.1)
+    return False
+
+
+def start_server(script, port, log_path):
+    """Inicia el servidor (traffic_server.py o sharded_server.py) con su salida redirigida a log_path."""
+    server_dir = os.path.dirname(os.path.abspath(__file__))
+    log = open(log_path, 'w') if log_path else subprocess.DEVNULL
+    return subprocess.Popen(
+        [sys.executable, os.path.join(server_dir, script), '--port', str(port)],
+        cwd=server_dir, stdout=log, stderr=subprocess.STDOUT
+    )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Prueba de carga del servidor de movilidad urbana")
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=8585)
+    parser.add_argument('--clients', type=int, nargs='+', default=[1, 4, 16], help="Números de clientes a probar")
+    parser.add_argument('--spawn-every', type=int, nargs='+', default=[10, 3, 2],
+                        help="Valores de spawnEvery a probar (menos pasos entre spawns, más coches)")
+    parser.add_argument('--warmup', type=int, nargs='+', default=[500],
+                        help="Pasos que se adelanta el modelo antes de medir, para estabilizar el número de coches")
+    parser.add_argument('--duration', type=float, default=10.0, help="Segundos de medición por escenario")
+    parser.add_argument('--static', action='store_true',
+                        help="Pedir también obstáculos, destinos y calles en cada frame, como el cliente actual")
+    parser.add_argument('--timeout', type=float, default=30.0, help="Tiempo máximo por llamada en segundos")
+    parser.add_argument('--no-server', action='store_true', help="Usar un servidor ya iniciado en --host/--port")
+    parser.add_argument('--server', default='traffic_server.py', help="Servidor a iniciar")
+    parser.add_argument('--sessions', action='store_true',
+                        help="Una sesión por cliente (X-Session-Id), para sharded_server.py")
+    parser.add_argument('--server-log', default=None, help="Archivo para la salida del servidor iniciado")
+    parser.add_argument('--json', default=None, help="Archivo donde guardar los resultados en JSON")
+    args = parser.parse_args()
+
+    server = None
+    if not args.no_server:
+        server = start_server(args.server, args.port, args.server_log)
+    try:
+        if not wait_for_port(args.host, args.port, 30):
+            sys.exit(f"El servidor no responde en {args.host}:{args.port}")
+        results = []
+        for spawn_every in args.spawn_every:
+            for warmup in args.warmup:
+                for clients in args.clients:
+                    result = run_scenario(args.host, args.port, clients, spawn_every, warmup, args.duration,
+                                          args.static, args.timeout, args.sessions)
+                    print_scenario(result)
+                    results.append(result)
+        if args.json:
+            with open(args.json, 'w') as f:
+                json.dump(results, f, indent=2)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
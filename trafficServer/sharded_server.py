@@ -0,0 +1,193 @@
+# Reto - Movilidad Urbana
+# Modelación de Sistemas Multiagentes con Gráficas Computacionales
+# 28/11/2024
+# Francisco José Urquizo Schnaas A01028786
+# Gabriel Edid Harari A01782146
+# sharded_server.py
+#
+# Servidor frontal con los mismos endpoints que traffic_server.py, pero con sesiones repartidas
+# entre varios procesos worker (uno por núcleo por defecto). Cada sesión tiene su propio
+# CityModel en un worker; el cliente la indica con el encabezado X-Session-Id, el parámetro
+# session o el campo session del JSON. Las peticiones sin sesión usan la sesión "default".
+
+import argparse
+from flask import Flask, request, jsonify
+from flask_cors import CORS
+
+from trafficBase.pool import model_config, update_options
+from trafficBase.analytics import heatmap_encoding
+from trafficBase.sharding import ShardRouter
+from trafficBase.spatial import TILE_SIZE, parse_viewport, viewport_response
+
+# Router de sesiones; se crea al ejecutar el servidor (los workers no se inician al importar)
+router = None
+
+# Inicializar la aplicación Flask
+app = Flask(__name__)
+CORS(app)
+
+def sessionId():
+    """Retorna el identificador de sesión de la petición actual."""
+    data = request.get_json(silent=True) or {}
+    return (request.headers.get('X-Session-Id') or request.args.get('session')
+            or data.get('session') or 'default')
+
+def currentSession():
+    """Retorna la sesión de la petición actual, o None si no se ha inicializado."""
+    return router.get(sessionId())
+
+def viewportPositions(session, kind):
+    """
+    Respuesta de posiciones limitada a la caja o tile de la petición, o completa si no se pidió ninguna.
+
+    kind es "agents" (coches del último frame) o un tipo de la capa estática; la caja se consulta
+    en el índice por cubetas de la sesión o del frame, sin recorrer toda la ciudad.
+    """
+    width, height = session.static["width"], session.static["height"]
+    try:
+        view = parse_viewport(request.args, width, height)
+    except ValueError as e:
+        return jsonify({"message": "Caja o tile inválido.", "error": str(e)}), 400
+    if kind == "agents":
+        frame = session.frame
+        if view is None:
+            return jsonify({'positions': frame.positions()}), 200
+        index = frame.positions_index(width, height)
+    else:
+        if view is None:
+            return jsonify({'positions': session.static[kind]}), 200
+        index = session.indexes[kind]
+    return jsonify(viewport_response('positions', index.view(view), *view)), 200
+
+# Endpoint para inicializar el modelo de una sesión
+@app.route('/init', methods=['POST'])
+def initModel():
+    try:
+        data = request.get_json() or {}
+        session_id = router.new_session_id() if data.get('newSession') else sessionId()
+        session = router.init(session_id, model_config(data))
+        return jsonify({
+            "message": "Parámetros recibidos, modelo iniciado.",
+            "session": session.id,
+            "worker": session.worker.index,
+            "number_agents": int(data.get('NAgents', 10)),
+            "car_agents": session.frame.positions(),
+            "obstacle_agents": session.static["obstacles"],
+            "width": session.static["width"],
+            "height": session.static["height"],
+            "tileSize": TILE_SIZE
+        }), 200
+    except ValueError as e:
+        return jsonify({"message": "Parámetros de /init inválidos.", "error": str(e)}), 400
+    except Exception as e:
+        print(f"Error al inicializar el modelo: {e}")
+        return jsonify({"message": "Error al inicializar el modelo.", "error": str(e)}), 500
+
+# Endpoint para actualizar el modelo de una sesión
+@app.route('/update', methods=['POST'])
+def updateModel():
+    session = currentSession()
+    if session is None:
+        return jsonify({"message": "Modelo no inicializado."}), 400
+    try:
+        data = request.get_json() or {}
+        try:
+            options = update_options(data)
+        except ValueError as e:
+            return jsonify({"message": "Parámetros de /update inválidos.", "error": str(e)}), 400
+        frames = router.update(session, options)
+        response = {"currentStep": session.frame.step}
+        if options["frameEvery"] and options["fastForward"]:
+            response["frames"] = frames
+        if data.get('returnState', False):
+            response["state"] = session.frame.snapshot()
+        return jsonify(response), 200
+    except Exception as e:
+        print(f"Error al actualizar el modelo: {e}")
+        return jsonify({"message": "Error al actualizar el modelo.", "error": str(e)}), 500
+
+# Endpoint para obtener posiciones de los agentes Car (desde el último frame de la sesión)
+@app.route('/getAgents', methods=['GET'])
+def getAgents():
+    session = currentSession()
+    if session is None:
+        return jsonify({"message": "Modelo no inicializado."}), 400
+    return viewportPositions(session, "agents")
+
+# Endpoint para obtener posiciones y estados de los agentes Traffic_Light
+@app.route('/getTrafficLights', methods=['GET'])
+def getTrafficLights():
+    session = currentSession()
+    if session is None:
+        return jsonify({"message": "Modelo no inicializado."}), 400
+    return jsonify({'trafficLights': session.frame.traffic_lights()}), 200
+
+# Endpoints de la capa estática (se guardan en el proceso frontal al iniciar la sesión)
+@app.route('/getObstacles', methods=['GET'])
+def getObstacles():
+    session = currentSession()
+    if session is None:
+        return jsonify({"message": "Modelo no inicializado."}), 400
+    return viewportPositions(session, "obstacles")
+
+@app.route('/getDestinations', methods=['GET'])
+def getDestinations():
+    session = currentSession()
+    if session is None:
+        return jsonify({"message": "Modelo no inicializado."}), 400
+    return viewportPositions(session, "destinations")
+
+@app.route('/getRoads', methods=['GET'])
+def getRoads():
+    session = currentSession()
+    if session is None:
+        return jsonify({"message": "Modelo no inicializado."}), 400
+    return viewportPositions(session, "roads")
+
+# Endpoint para obtener las métricas de congestión de una sesión
+@app.route('/heatmap', methods=['GET'])
+def getHeatmap():
+    session = currentSession()
+    if session is None:
+        return jsonify({"message": "Modelo no inicializado."}), 400
+    try:
+        encoding = heatmap_encoding(request.args.get('encoding', 'list'))
+    except ValueError as e:
+        return jsonify({"message": "Codificación de /heatmap inválida.", "error": str(e)}), 400
+    try:
+        payload = router.heatmap(session, encoding)
+        if payload is None:
+            return jsonify({"message": "Las métricas de congestión están desactivadas."}), 400
+        return jsonify(payload), 200
+    except Exception as e:
+        print(f"Error al recuperar las métricas de congestión: {e}")
+        return jsonify({'message': 'Error al recuperar las métricas de congestión.', 'error': str(e)}), 500
+
+# Endpoint para cerrar una sesión y liberar su modelo
+@app.route('/close', methods=['POST'])
+def closeSession():
+    if not router.close(sessionId()):
+        return jsonify({"message": "Sesión no encontrada."}), 404
+    return jsonify({"message": "Sesión cerrada."}), 200
+
+# Endpoint con el estado de los workers (sesiones, carga y migraciones)
+@app.route('/workers', methods=['GET'])
+def getWorkers():
+    return jsonify(router.status()), 200
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Servidor de movilidad urbana con sesiones en varios procesos")
+    parser.add_argument('--port', type=int, default=8585, help="Puerto del servidor")
+    parser.add_argument('--workers', type=int, default=None, help="Procesos worker (por defecto uno por núcleo)")
+    parser.add_argument('--pool-size', type=int, default=1, help="Modelos precalentados por worker")
+    parser.add_argument('--overload', type=float, default=0.75, help="Carga (0 a 1) a partir de la cual se migran sesiones")
+    parser.add_argument('--rebalance-interval', type=float, default=2.0, help="Segundos entre rebalanceos")
+    parser.add_argument('--verbose', action='store_true', help="Imprimir los eventos de los agentes en los workers")
+    args = parser.parse_args()
+
+    router = ShardRouter(args.workers, args.pool_size, args.verbose, args.overload, args.rebalance_interval)
+    try:
+        app.run(host="0.0.0.0", port=args.port, threaded=True, use_reloader=False)
+    finally:
+        router.shutdown()
@@ -0,0 +1,76 @@
+/*
+ * Reto - Movilidad Urbana
+ * Modelación de Sistemas Multiagentes con Gráficas Computacionales
+ * 28/11/2024
+ * Francisco José Urquizo Schnaas A01028786
+ * Gabriel Edid Harari A01782146
+ * StaticLayerModule.js
+ */
+
+"use strict";
+
+/**
+ * Módulo de visualización para la interfaz de Mesa con capa estática en caché.
+ * Usa dos canvas superpuestos: el inferior dibuja calles, obstáculos y destinos una sola vez
+ * (cuando el servidor envía "static") y el superior se limpia y redibuja en cada frame solo
+ * con coches y semáforos.
+ * @param {number} canvas_width - Ancho del canvas en píxeles.
+ * @param {number} canvas_height - Alto del canvas en píxeles.
+ * @param {number} grid_width - Ancho del grid en celdas.
+ * @param {number} grid_height - Alto del grid en celdas.
+ */
+const StaticLayerModule = function (canvas_width, canvas_height, grid_width, grid_height) {
+  const parent = document.createElement("div");
+  parent.className = "world-grid-parent";
+  parent.style.height = `${canvas_height}px`;
+
+  const createCanvas = () => {
+    const canvas = document.createElement("canvas");
+    canvas.width = canvas_width;
+    canvas.height = canvas_height;
+    canvas.className = "world-grid";
+    parent.appendChild(canvas);
+    return canvas.getContext("2d");
+  };
+  const staticContext = createCanvas(); // Capa estática, se dibuja una vez por modelo
+  const dynamicContext = createCanvas(); // Capa de coches y semáforos, se dibuja cada frame
+
+  document.getElementById("elements").appendChild(parent);
+
+  const cellWidth = Math.floor(canvas_width / grid_width);
+  const cellHeight = Math.floor(canvas_height / grid_height);
+  let styles = {}; // Estilo de cada tipo de agente, enviado junto con la capa estática
+
+  /**
+   * Dibuja rectángulos centrados en las celdas indicadas.
+   * @param {CanvasRenderingContext2D} context - Contexto donde dibujar.
+   * @param {Array} cells - Lista de posiciones [x, y].
+   * @param {Object} style - Color y tamaño (w, h como fracción de la celda).
+   */
+  const drawCells = (context, cells, style) => {
+    if (!style) return;
+    const w = style.w * cellWidth;
+    const h = style.h * cellHeight;
+    context.fillStyle = style.Color;
+    for (const [x, y] of cells) {
+      // El eje y del canvas crece hacia abajo, el del grid hacia arriba
+      const left = x * cellWidth + (cellWidth - w) / 2;
+      const top = (grid_height - y - 1) * cellHeight + (cellHeight - h) / 2;
+      context.fillRect(left, top, w, h);
+    }
+  };
+
+  this.render = (data) => {
+    if (data.static) {
+      styles = data.styles;
+      staticContext.clearRect(0, 0, canvas_width, canvas_height);
+      for (const type in data.static) drawCells(staticContext, data.static[type], styles[type]);
+    }
+    dynamicContext.clearRect(0, 0, canvas_width, canvas_height);
+    for (const type in data.dynamic) drawCells(dynamicContext, data.dynamic[type], styles[type]);
+  };
+
+  this.reset = () => {
+    dynamicContext.clearRect(0, 0, canvas_width, canvas_height);
+  };
+};
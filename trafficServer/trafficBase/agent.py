@@ -10,6 +10,10 @@ agent.py
 # Importaciones necesarias desde las bibliotecas estándar y la biblioteca Mesa
 import heapq  # Para implementar la cola de prioridad utilizada en el algoritmo A*
 from mesa import Agent  # Clase base para agentes en Mesa
+from .pathfinding import DStarLite, HierarchicalPlanner  # Planificadores de rutas
+from .scheduler import PRIORITY_NEW, PRIORITY_STUCK, PRIORITY_REFRESH  # Prioridades de la cola de planificación
+
+PARK_TIMEOUT = 3  # Pasos máximos que un coche espera estacionado detrás de otro coche
 
 class Car(Agent):
     """
@@ -18,6 +22,9 @@ class Car(Agent):
     Este agente representa un coche en la simulación de tráfico. El coche calcula una ruta hacia su destino,
     detecta obstáculos como otros coches, semáforos en rojo y obstáculos físicos, y puede intentar cambiar de carril
     para evitar quedarse atascado.
+
+    La ruta no se guarda como lista propia: el coche guarda el identificador de una ruta en el
+    almacén compartido del modelo (route_store) y un cursor sobre ella.
     """
 
     def __init__(self, unique_id, model, destination_pos):
@@ -31,9 +38,45 @@ class Car(Agent):
         """
         super().__init__(unique_id, model)
         self.destination_pos = destination_pos  # Posición objetivo del coche
-        self.path = None  # Ruta calculada hacia el destino
+        self.route = None  # Identificador de la ruta calculada en el almacén compartido
+        self.cursor = 0  # Índice de la siguiente celda de la ruta
         self.last_position = None  # Última posición del coche
         self.stuck_counter = 0  # Contador para rastrear cuánto tiempo ha estado el coche en la misma posición
+        self.planner = None  # Estado de búsqueda incremental que se conserva entre replanificaciones
+
+    @property
+    def path(self):
+        """
+        Celdas restantes de la ruta, o None si no se ha calculado.
+
+        Construye una lista nueva en cada acceso; en el movimiento se usan next_cell y advance.
+        """
+        if self.route is None:
+            return None
+        return self.model.route_store.cells_from(self.route, self.cursor)
+
+    @path.setter
+    def path(self, path):
+        """Reemplaza la ruta del coche, compartiéndola si otro coche ya tiene una idéntica."""
+        store = self.model.route_store
+        if self.route is not None:
+            store.release(self.route)
+        self.route = None if path is None else store.intern(path)
+        self.cursor = 0
+
+    def has_next(self):
+        """Indica si quedan celdas por recorrer en la ruta."""
+        return self.route is not None and self.cursor < self.model.route_store.length(self.route)
+
+    def next_cell(self):
+        """Retorna la siguiente celda de la ruta sin consumirla, o None si no hay."""
+        if not self.has_next():
+            return None
+        return self.model.route_store.cell(self.route, self.cursor)
+
+    def advance(self):
+        """Consume la siguiente celda de la ruta."""
+        self.cursor += 1
 
     def heuristic(self, a, b):
         """
@@ -68,7 +111,7 @@ class Car(Agent):
         Returns:
             bool: True si hay un coche en la siguiente posición de la ruta, False en caso contrario.
         """
-        next_move = self.path[0] if self.path else None
+        next_move = self.next_cell()
         if next_move:
             agents_at_next = self.model.grid.get_cell_list_contents([next_move])
             return any(isinstance(agent, Car) for agent in agents_at_next)
@@ -92,7 +135,8 @@ class Car(Agent):
                 current_direction = agent.direction
                 break
         if current_direction is None:
-            print(f"{self.unique_id}: Not on a road. Cannot switch lanes.")
+            if self.model.verbose:
+                print(f"{self.unique_id}: Not on a road. Cannot switch lanes.")
             return False
 
         # Determinar carriles posibles basados en la dirección actual
@@ -108,7 +152,8 @@ class Car(Agent):
                 (current_x, current_y - 1)   # Carril inferior
             ]
         else:
-            print(f"{self.unique_id}: Unknown direction {current_direction}. Cannot switch lanes.")
+            if self.model.verbose:
+                print(f"{self.unique_id}: Unknown direction {current_direction}. Cannot switch lanes.")
             return False
 
         # Verificar carriles posibles
@@ -138,140 +183,102 @@ class Car(Agent):
 
             if lane_clear and lane_direction == current_direction:
                 # Cambiar de carril
-                print(f"{self.unique_id}: Switching lanes to {lane}")
-                self.model.grid.move_agent(self, lane)
-                print(f"{self.unique_id}: Switched lanes to {lane}")
-                # Recalcular ruta desde la nueva posición
-                self.path = self.find_path()
+                if self.model.verbose:
+                    print(f"{self.unique_id}: Switching lanes to {lane}")
+                self.model.move_car(self, lane)
+                if self.model.verbose:
+                    print(f"{self.unique_id}: Switched lanes to {lane}")
+                # Recalcular ruta desde la nueva posición (con presupuesto, esperar turno sin ruta)
+                if self.model.route_budgeted:
+                    self.path = None
+                    self.model.request_route(self, PRIORITY_NEW)
+                else:
+                    self.path = self.find_path()
                 return True
 
-        print(f"{self.unique_id}: Unable to switch lanes.")
+        if self.model.verbose:
+            print(f"{self.unique_id}: Unable to switch lanes.")
         return False
 
     def find_path(self):
+        """
+        Encuentra una ruta hacia el destino con el planificador configurado en el modelo.
+
+        Con el planificador incremental se reutiliza el estado de búsqueda del coche y solo se
+        reparan las celdas cuyo costo cambió desde la última llamada. Con el jerárquico la
+        ruta retornada cubre solo los próximos clusters y se extiende cuando se agota.
+
+        Returns:
+            list: Lista de coordenadas (x, y) que representan la ruta hacia el destino, excluyendo la posición actual.
+                  Retorna una lista vacía si no se encuentra ninguna ruta.
+        """
+        if self.model.planner not in ("incremental", "hierarchical"):
+            return self.find_path_astar()
+
+        if self.planner is None:
+            if self.model.planner == "hierarchical":
+                self.planner = HierarchicalPlanner(self.model, self.destination_pos)
+            else:
+                self.planner = DStarLite(self.model, self.destination_pos)
+        expansions = self.planner.expansions
+        path = self.planner.plan(self.pos)
+        self.model.expansions += self.planner.expansions - expansions
+        if not path:
+            if self.model.verbose:
+                print(f"No path found for {self.unique_id} from {self.pos} to {self.destination_pos}.")
+        return path
+
+    def find_path_astar(self):
         """
         Encuentra una ruta válida desde la posición actual hasta el destino utilizando el algoritmo A*.
-        
+
+        Los vecinos salen de la red de calles del modelo (que ya descarta sentidos contrarios,
+        obstáculos y destinos ajenos) y el costo de cada celda del campo de congestión del paso,
+        igual que en los demás planificadores; no se consulta el grid durante la búsqueda.
+
         Returns:
             list: Lista de coordenadas (x, y) que representan la ruta hacia el destino, excluyendo la posición actual.
                   Retorna una lista vacía si no se encuentra ninguna ruta.
         """
         start = self.pos  # Posición inicial del coche
         goal = self.destination_pos  # Posición objetivo del coche
-        grid = self.model.grid  # Referencia al espacio de la cuadrícula
+        network = self.model.road_network  # Grafo estático de celdas transitables
+        costs = self.model.cost_field.costs  # Costos de congestión del paso (1 si no aparece)
 
-        # Inicializar la cola de prioridad con el nodo de inicio
-        open_set = []
-        heapq.heappush(open_set, (0 + self.heuristic(start, goal), 0, start, [start]))
+        # Cola de prioridad (f, g, celda) con el mejor g conocido de cada celda
+        open_set = [(self.heuristic(start, goal), 0, start)]
+        best_g = {start: 0}
+        came_from = {}  # Celda -> celda desde la que se llegó con best_g
         closed_set = set()  # Conjunto de nodos ya evaluados
 
-        def is_traversable(current, neighbor):
-            """
-            Verifica si una celda vecina es transitable desde la celda actual.
-            
-            Args:
-                current (tuple): Coordenadas (x, y) de la celda actual.
-                neighbor (tuple): Coordenadas (x, y) de la celda vecina.
-            
-            Returns:
-                bool: True si la celda vecina es transitable, False en caso contrario.
-            """
-            agents_at_neighbor = grid.get_cell_list_contents([neighbor])
-
-            # Determinar la dirección prevista basada en el movimiento
-            intended_direction = (neighbor[0] - current[0], neighbor[1] - current[1])
-            opposite_direction = ""
-            if intended_direction == (1, 0):
-                opposite_direction = "Left"
-            elif intended_direction == (-1, 0):
-                opposite_direction = "Right"
-            elif intended_direction == (0, 1):
-                opposite_direction = "Down"
-            elif intended_direction == (0, -1):
-                opposite_direction = "Up"
-
-            for agent in agents_at_neighbor:
-                if isinstance(agent, Road) and agent.direction == opposite_direction:
-                    return False
-                if isinstance(agent, Destination) and neighbor != self.destination_pos:
-                    return False  # Solo se permite el propio destino
-
-            return True
-
         while open_set:
-            f_score, g_score, current, path = heapq.heappop(open_set)
+            f_score, g_score, current = heapq.heappop(open_set)
 
             if current == goal:
-                return path[1:]  # Retornar la ruta excluyendo la posición actual
+                self.model.expansions += len(closed_set)
+                path = []
+                while current != start:
+                    path.append(current)
+                    current = came_from[current]
+                path.reverse()
+                return path  # Ruta excluyendo la posición actual
 
             if current in closed_set:
                 continue
             closed_set.add(current)
 
-            # Obtener vecinos adyacentes (sin diagonales)
-            neighbors = grid.get_neighborhood(
-                current,
-                moore=False,
-                include_center=False
-            )
-
-            for neighbor in neighbors:
+            for neighbor in network.successors(current, goal):
                 if neighbor in closed_set:
                     continue
-
-                if not is_traversable(current, neighbor):
-                    continue
-
-                # Verificar si el vecino es transitable (Carretera, Destino propio, o Semáforo)
-                agents_at_neighbor = grid.get_cell_list_contents([neighbor])
-                traversable = False
-                car_present = False
-                for agent in agents_at_neighbor:
-                    if isinstance(agent, Road) or isinstance(agent, Traffic_Light):
-                        traversable = True
-                    elif isinstance(agent, Destination):
-                        if neighbor == self.destination_pos:
-                            traversable = True
-                        else:
-                            traversable = False
-                            break  # No transitable si es otro destino
-                    elif isinstance(agent, Car):
-                        # Permitir la travesía pero marcar que hay un coche presente
-                        traversable = True
-                        car_present = True
-
-                if not traversable:
-                    continue
-
-                # Añadir costo de cambio de carril
-                lane_change_cost = 0
-                if self.pos and ((current[0] != neighbor[0]) and (current[1] != neighbor[1])):
-                    lane_change_cost = 1  # Penalizar cambios de carril
-
-                # Añadir penalización si hay un coche presente en la celda vecina
-                car_penalty = 5 if car_present else 0
-
-                tentative_g_score = g_score + 1 + lane_change_cost + car_penalty  # Asumir costo uniforme
-
-                # Verificar si el vecino ya está en open_set con un g_score menor
-                in_open_set = False
-                for item in open_set:
-                    if item[2] == neighbor and tentative_g_score >= item[1]:
-                        in_open_set = True
-                        break
-
-                if not in_open_set:
-                    heapq.heappush(
-                        open_set,
-                        (
-                            tentative_g_score + self.heuristic(neighbor, goal),  # f_score
-                            tentative_g_score,  # g_score
-                            neighbor,
-                            path + [neighbor]  # Ruta actualizada
-                        )
-                    )
-
-        print(f"No path found for {self.unique_id} from {start} to {goal}.")
+                tentative_g_score = g_score + costs.get(neighbor, 1)
+                if tentative_g_score < best_g.get(neighbor, tentative_g_score + 1):
+                    best_g[neighbor] = tentative_g_score
+                    came_from[neighbor] = current
+                    heapq.heappush(open_set, (tentative_g_score + self.heuristic(neighbor, goal), tentative_g_score, neighbor))
+
+        self.model.expansions += len(closed_set)
+        if self.model.verbose:
+            print(f"No path found for {self.unique_id} from {start} to {goal}.")
         return []
 
     def step(self):
@@ -289,57 +296,89 @@ class Car(Agent):
         self.last_position = self.pos
 
         # Verificar si el coche ha estado atascado por demasiado tiempo
-        if self.stuck_counter > 2:  # Reducido de 7 a 2
-            print(f"{self.unique_id}: Stuck for {self.stuck_counter} steps. Finding alternate path.")
-            self.path = self.find_path()
+        # (en un bloqueo total las replanificaciones se espacian de forma exponencial; si ya espera
+        # en la cola de planificación sigue con su ruta actual)
+        if (self.stuck_counter > 2 and not self.model.route_pending(self)
+                and self.model.may_replan(self)):  # Reducido de 7 a 2
+            if self.model.verbose:
+                print(f"{self.unique_id}: Stuck for {self.stuck_counter} steps. Finding alternate path.")
+            if self.model.batch_routes:
+                self.model.request_route(self, PRIORITY_STUCK)  # Se resuelve en la fase de planificación del siguiente paso
+            else:
+                self.path = self.find_path()
             self.stuck_counter = 0  # Reiniciar el contador
             return
 
         # Lógica de búsqueda de ruta
-        if self.path is None:
+        if self.route is None:
+            if self.model.route_pending(self):
+                self.model.note_unblocked(self)
+                return  # Espera su turno en la cola de planificación
             self.path = self.find_path()
-            if not self.path:
-                print(f"{self.unique_id}: No initial path found.")
+            if not self.has_next():
+                if self.model.verbose:
+                    print(f"{self.unique_id}: No initial path found.")
+                self.model.note_unblocked(self)
                 return
 
         # Verificar si hay un coche delante y intentar cambiar de carril
+        # (el cambio de carril replanifica, así que en un bloqueo total también espera su turno)
         if self.detect_car_in_front():
-            if not self.switch_lanes():
-                print(f"{self.unique_id}: Waiting for the car in front to move.")
+            if self.model.note_blocked(self, self.next_cell()):
+                return  # Cedió la celda para romper un ciclo; sigue la ruta nueva en el siguiente paso
+            if not (self.model.may_replan(self) and self.switch_lanes()):
+                if self.model.verbose:
+                    print(f"{self.unique_id}: Waiting for the car in front to move.")
+                self.model.wait_on(self, self.next_cell(), timeout=PARK_TIMEOUT)  # Despertar cuando avance
                 return
 
         # Moverse a lo largo de la ruta
-        if self.path:
-            next_move = self.path[0]  # Obtener el siguiente movimiento sin eliminarlo
+        if self.has_next():
+            next_move = self.next_cell()  # Obtener el siguiente movimiento sin eliminarlo
             agents_at_next = self.model.grid.get_cell_list_contents([next_move])
 
             can_move = True
+            can_park = True  # El bloqueo es temporal (semáforo o coche) y se puede esperar estacionado
+            wait_timeout = None  # Un semáforo avisa al cambiar; detrás de un coche se espera con límite
             for agent in agents_at_next:
                 if isinstance(agent, Traffic_Light) and not agent.state:
                     can_move = False  # Semáforo rojo bloquea el movimiento
                 elif isinstance(agent, Obstacle):
                     can_move = False  # Obstáculo bloquea el movimiento
+                    can_park = False
                 elif isinstance(agent, Car):
                     can_move = False  # Otro coche bloquea el movimiento
+                    wait_timeout = PARK_TIMEOUT
                 elif isinstance(agent, Destination) and next_move != self.destination_pos:
                     can_move = False  # No se puede mover a destinos de otros coches
+                    can_park = False
 
             if can_move:
-                self.model.grid.move_agent(self, next_move)
-                print(f"{self.unique_id} moved to {next_move}")
-                self.path.pop(0)  # Eliminar el movimiento después de moverse
+                self.model.move_car(self, next_move)
+                if self.model.verbose:
+                    print(f"{self.unique_id} moved to {next_move}")
+                self.advance()  # Avanzar el cursor de la ruta después de moverse
                 self.stuck_counter = 0  # Reiniciar el contador de atascamiento al moverse
             else:
-                print(f"{self.unique_id} blocked at {next_move}, waiting for green light or car to move or obstacle to clear.")
+                if self.model.verbose:
+                    print(f"{self.unique_id} blocked at {next_move}, waiting for green light or car to move or obstacle to clear.")
+                if self.model.note_blocked(self, next_move):
+                    return  # Cedió la celda para romper un ciclo; sigue la ruta nueva en el siguiente paso
+                if can_park:
+                    self.model.wait_on(self, next_move, timeout=wait_timeout)
         else:
             if self.pos == self.destination_pos:
-                print(f"{self.unique_id} has arrived at the destination.")
-                self.model.grid.remove_agent(self)  # Eliminar el agente de la cuadrícula
-                self.model.schedule.remove(self)  # Eliminar el agente del scheduler
+                if self.model.verbose:
+                    print(f"{self.unique_id} has arrived at the destination.")
+                self.model.remove_car(self)  # Eliminar el agente de la cuadrícula y del scheduler
                 self.model.cars_in_sim -= 1  # Decrementar el contador de coches en la simulación
                 self.model.reached_destinations += 1  # Incrementar el contador de destinos alcanzados
             else:
-                self.path = self.find_path()
+                self.model.note_unblocked(self)  # Sin ruta que seguir no espera a nadie
+                if self.model.route_budgeted:
+                    self.model.request_route(self, PRIORITY_REFRESH)  # Sigue la ruta nueva cuando se le atienda
+                else:
+                    self.path = self.find_path()
 
 class Traffic_Light(Agent):
     """
@@ -372,7 +411,10 @@ class Traffic_Light(Agent):
         if self.model.schedule.steps % self.timeToChange == 0:
             self.state = not self.state  # Cambiar el estado del semáforo
             state_str = "Green" if self.state else "Red"
-            print(f"Traffic Light {self.unique_id} changed to {state_str}")
+            if self.model.verbose:
+                print(f"Traffic Light {self.unique_id} changed to {state_str}")
+            if self.state:
+                self.model.notify_cell(self.pos)  # Despertar a los coches que esperan el verde
 
 class Destination(Agent):
     """
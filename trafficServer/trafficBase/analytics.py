@@ -0,0 +1,239 @@
+"""
+Reto - Movilidad Urbana
+Modelación de Sistemas Multiagentes con Gráficas Computacionales
+28/11/2024
+Francisco José Urquizo Schnaas A01028786
+Gabriel Edid Harari A01782146
+analytics.py
+"""
+
+# Importaciones necesarias desde las bibliotecas estándar y NumPy
+import base64  # Para enviar los mapas de calor como enteros empaquetados
+import numpy as np  # Acumuladores de las métricas por celda, semáforo y destino
+
+NO_LIGHT = -1  # Espera que no se atribuye a ningún semáforo
+HEATMAP_ENCODINGS = ("list", "base64")  # Codificaciones de los mapas de /heatmap
+
+
+class CongestionStats:
+    """
+    Acumuladores de congestión actualizados por eventos.
+
+    En lugar de recorrer todas las celdas en cada paso, cada métrica se lleva como intervalos:
+    al entrar un coche a una celda se resta el paso actual y al salir se suma, de modo que el
+    acumulado más el paso actual por cada celda ocupada da los ticks de ocupación. Lo mismo se
+    hace con las esperas de coches bloqueados (que pueden estar estacionados sin activarse) y con
+    la duración de los viajes. El costo es proporcional a los movimientos, no al tamaño del mapa.
+
+    Los acumuladores por celda son diccionarios dispersos que solo guardan las celdas por las que
+    pasó algún coche; los mapas densos de (alto, ancho) se arman únicamente en snapshot.
+    """
+
+    def __init__(self, model):
+        """
+        Inicializa los acumuladores con la capa estática del modelo.
+
+        Args:
+            model (CityModel): Modelo cuyas calles, semáforos y destinos ya están colocados.
+        """
+        self.width = model.width
+        self.height = model.height
+        self.start_step = model.step_count
+        self.lights = [light for light in model.traffic_lights if light.pos is not None]
+        self.destinations = [destination for destination in model.destinations if destination.pos is not None]
+        self.light_index = {light.pos: i for i, light in enumerate(self.lights)}
+        self.destination_index = {destination.pos: i for i, destination in enumerate(self.destinations)}
+
+        self.occupancy = {}  # Celda -> ticks con un coche en la celda
+        self.wait = {}  # Celda -> ticks de coches bloqueados en la celda
+        self.queue_ticks = np.zeros(len(self.lights), dtype=np.int64)  # Ticks de espera por semáforo
+        self.trip_count = np.zeros(len(self.destinations), dtype=np.int64)
+        self.trip_total = np.zeros(len(self.destinations), dtype=np.int64)  # Suma de duraciones
+        self.trip_max = np.zeros(len(self.destinations), dtype=np.int64)
+
+        self.car_at = {}  # Celda -> coche que la ocupa
+        self.waits = {}  # Coche bloqueado -> (paso de inicio, semáforo atribuido)
+        self.trips = {}  # Coche -> paso en que apareció
+
+    def enter(self, car, pos, step):
+        """Registra que un coche ocupa una celda a partir de step."""
+        self.occupancy[pos] = self.occupancy.get(pos, 0) - step
+        self.car_at[pos] = car
+
+    def leave(self, car, pos, step):
+        """Registra que un coche deja una celda en step y cierra su espera, si la hay."""
+        self.occupancy[pos] += step
+        if self.car_at.get(pos) is car:
+            del self.car_at[pos]
+        if car in self.waits:
+            self.close_wait(car, pos, step)
+
+    def spawn(self, car, pos, step):
+        """Registra un coche nuevo: ocupa su celda y empieza su viaje."""
+        self.enter(car, pos, step)
+        self.trips[car] = step
+
+    def arrive(self, car, pos, step):
+        """Registra la llegada de un coche a su destino y la duración de su viaje."""
+        self.leave(car, pos, step)
+        start = self.trips.pop(car, None)
+        i = self.destination_index.get(car.destination_pos)
+        if start is None or i is None:
+            return
+        duration = step - start
+        self.trip_count[i] += 1
+        self.trip_total[i] += duration
+        if duration > self.trip_max[i]:
+            self.trip_max[i] = duration
+
+    def attribution(self, cell):
+        """Retorna el semáforo al que se atribuye una espera frente a cell (o NO_LIGHT)."""
+        light = self.light_index.get(cell)
+        if light is not None:
+            return light
+        blocker = self.car_at.get(cell)
+        if blocker is not None and blocker in self.waits:
+            return self.waits[blocker][1]  # La cola detrás de un coche que espera un semáforo
+        return NO_LIGHT
+
+    def block(self, car, cell, step):
+        """
+        Registra que un coche está bloqueado frente a una celda.
+
+        Si ya estaba bloqueado se conserva su espera, salvo que ahora se atribuya a otro
+        semáforo; en ese caso se cierra el tramo anterior y se abre uno nuevo.
+        """
+        light = self.attribution(cell)
+        current = self.waits.get(car)
+        if current is not None:
+            if current[1] == light:
+                return
+            self.close_wait(car, car.pos, step)
+        self.waits[car] = (step, light)
+
+    def unblock(self, car, step):
+        """Cierra la espera de un coche que sigue en su celda pero ya no está bloqueado."""
+        if car in self.waits:
+            self.close_wait(car, car.pos, step)
+
+    def close_wait(self, car, pos, step):
+        """Cierra la espera de un coche y la suma a su celda y a su semáforo."""
+        start, light = self.waits.pop(car)
+        duration = step - start
+        self.wait[pos] = self.wait.get(pos, 0) + duration
+        if light != NO_LIGHT:
+            self.queue_ticks[light] += duration
+
+    def dense(self, cells):
+        """Retorna un acumulador disperso por celda como arreglo de (alto, ancho)."""
+        grid = np.zeros((self.height, self.width), dtype=np.int64)
+        if cells:
+            xs, ys = zip(*cells)
+            grid[np.array(ys), np.array(xs)] = np.fromiter(cells.values(), dtype=np.int64, count=len(cells))
+        return grid
+
+    def snapshot(self, step):
+        """
+        Retorna las métricas acumuladas hasta step, incluyendo ocupaciones y esperas abiertas.
+
+        Args:
+            step (int): Paso actual del modelo.
+
+        Returns:
+            dict: Arreglos de NumPy con las métricas por celda, semáforo y destino.
+        """
+        occupancy = self.dense(self.occupancy)
+        if self.car_at:
+            xs, ys = zip(*self.car_at)
+            np.add.at(occupancy, (np.array(ys), np.array(xs)), step)
+
+        wait = self.dense(self.wait)
+        queue_ticks = self.queue_ticks.copy()
+        queue_now = np.zeros(len(self.lights), dtype=np.int64)
+        for car, (start, light) in self.waits.items():
+            if car.pos is None:
+                continue
+            wait[car.pos[1], car.pos[0]] += step - start
+            if light != NO_LIGHT:
+                queue_ticks[light] += step - start
+                queue_now[light] += 1
+
+        return {
+            "ticks": step - self.start_step,
+            "occupancy": occupancy,
+            "wait": wait,
+            "queue_ticks": queue_ticks,
+            "queue_now": queue_now,
+            "trip_count": self.trip_count.copy(),
+            "trip_total": self.trip_total.copy(),
+            "trip_max": self.trip_max.copy(),
+        }
+
+
+def heatmap_encoding(encoding):
+    """
+    Valida la codificación pedida para los mapas de /heatmap.
+
+    Raises:
+        ValueError: Si no es una de HEATMAP_ENCODINGS.
+    """
+    if encoding not in HEATMAP_ENCODINGS:
+        raise ValueError(f"Se esperaba una de {HEATMAP_ENCODINGS}, se recibió {encoding!r}.")
+    return encoding
+
+
+def heatmap_response(stats, step, width, height, lights, destinations, encoding="list"):
+    """
+    Arma la respuesta de /heatmap a partir de los arreglos de CongestionStats.snapshot.
+
+    Los mapas se aplanan por filas (índice y * width + x); con encoding "base64" se envían
+    como enteros int32 little-endian codificados en base64.
+
+    Args:
+        stats (dict): Arreglos de NumPy de CongestionStats.snapshot.
+        step (int): Paso actual del modelo.
+        width, height (int): Tamaño del grid en celdas.
+        lights (list): (id, x, z) de cada semáforo, en el orden de los arreglos.
+        destinations (list): (id, x, z) de cada destino, en el orden de los arreglos.
+        encoding (str): "list" o "base64".
+
+    Returns:
+        dict: Respuesta de /heatmap.
+
+    Raises:
+        ValueError: Si encoding no es una de HEATMAP_ENCODINGS.
+    """
+    heatmap_encoding(encoding)
+
+    def encode_grid(grid):
+        if encoding == "base64":
+            return base64.b64encode(grid.astype("<i4").tobytes()).decode("ascii")
+        return grid.ravel().tolist()
+
+    ticks = max(1, stats["ticks"])
+    trips = stats["trip_count"]
+    return {
+        "step": step,
+        "ticks": stats["ticks"],
+        "width": width,
+        "height": height,
+        "encoding": encoding,
+        "occupancy": encode_grid(stats["occupancy"]),
+        "wait": encode_grid(stats["wait"]),
+        "lights": {
+            "ids": [light[0] for light in lights],
+            "x": [light[1] for light in lights],
+            "z": [light[2] for light in lights],
+            "queueTicks": stats["queue_ticks"].tolist(),
+            "queueNow": stats["queue_now"].tolist(),
+            "meanQueue": (stats["queue_ticks"] / ticks).round(3).tolist()
+        },
+        "destinations": {
+            "ids": [destination[0] for destination in destinations],
+            "x": [destination[1] for destination in destinations],
+            "z": [destination[2] for destination in destinations],
+            "trips": trips.tolist(),
+            "meanTripTime": (stats["trip_total"] / trips.clip(min=1)).round(2).tolist(),
+            "maxTripTime": stats["trip_max"].tolist()
+        }
+    }
@@ -0,0 +1,130 @@
+"""
+Reto - Movilidad Urbana
+Modelación de Sistemas Multiagentes con Gráficas Computacionales
+28/11/2024
+Francisco José Urquizo Schnaas A01028786
+Gabriel Edid Harari A01782146
+congestion.py
+"""
+
+# Importaciones necesarias desde bibliotecas externas
+import numpy as np  # Para calcular el campo de costos de forma vectorizada
+
+CAR_PENALTY = 5  # Costo extra de entrar a una celda ocupada por un coche
+
+
+class CostField:
+    """
+    Campo de costos de congestión compartido por todos los planificadores.
+
+    Se recalcula una vez por paso a partir de la capa de ocupación de coches: cada celda de la red
+    cuesta 1 más CAR_PENALTY por su densidad de coches. Con decay = 0 la densidad es la ocupación
+    del paso actual; con decay > 0 es un promedio exponencial de los pasos recientes, de modo que
+    las celdas de una fila detenida cuestan más que las que un coche solo cruzó. El costo se
+    redondea a enteros y solo las celdas cuyo costo cambió se agregan al registro, que es lo que
+    repara D* Lite. Los planificadores solo leen el diccionario costs.
+    """
+
+    def __init__(self, network, decay=0.0, penalty=CAR_PENALTY):
+        """
+        Inicializa el campo sin congestión.
+
+        Args:
+            network (RoadNetwork): Red de calles; el campo cubre sus celdas y destinos.
+            decay (float): Peso de la densidad anterior en el promedio (0 a 1).
+            penalty (int): Costo extra de una celda con densidad 1.
+        """
+        if not 0 <= decay < 1:
+            raise ValueError(f"decay debe estar en [0, 1): {decay}")
+        self.decay = decay
+        self.penalty = penalty
+        self.cells = sorted(network.cells | network.destinations)  # Celda de cada posición del vector
+        self.index = {cell: i for i, cell in enumerate(self.cells)}
+        self.occupied = np.zeros(len(self.cells))  # Capa de ocupación del paso actual
+        self.density = np.zeros(len(self.cells))  # Densidad suavizada
+        self.extra = np.zeros(len(self.cells), dtype=np.int64)  # Costo extra vigente de cada celda
+        self.costs = {}  # Celda -> costo, solo para las celdas con costo extra
+        self.log = []  # Celdas cuyo costo cambió, en orden
+        self.base = 0  # Número de secuencia del primer elemento de log
+
+    def update(self, car_cells):
+        """
+        Recalcula el campo a partir de las celdas ocupadas por coches.
+
+        Args:
+            car_cells (iterable): Celdas ocupadas actualmente.
+
+        Returns:
+            int: Número de celdas cuyo costo cambió.
+        """
+        index = self.index
+        occupied = self.occupied
+        occupied.fill(0)
+        occupied[[index[cell] for cell in car_cells if cell in index]] = 1
+        if self.decay:
+            self.density *= self.decay
+            self.density += (1 - self.decay) * occupied
+        else:
+            self.density = occupied
+        extra = np.rint(self.penalty * self.density).astype(np.int64)
+        changed = np.flatnonzero(extra != self.extra)
+        if len(changed):
+            cells = self.cells
+            costs = self.costs
+            for i, value in zip(changed.tolist(), extra[changed].tolist()):
+                cell = cells[i]
+                if value:
+                    costs[cell] = 1 + value
+                else:
+                    costs.pop(cell, None)
+                self.log.append(cell)
+        self.extra = extra
+        return len(changed)
+
+    def cost(self, pos):
+        """Retorna el costo de entrar a una celda."""
+        return self.costs.get(pos, 1)
+
+    def override(self, cell, cost):
+        """Fija temporalmente el costo de una celda (se registra para que D* Lite lo repare)."""
+        self.costs[cell] = cost
+        self.log.append(cell)
+
+    def restore(self, cell):
+        """Devuelve una celda fijada con override al costo calculado en el paso."""
+        extra = int(self.extra[self.index[cell]]) if cell in self.index else 0
+        if extra:
+            self.costs[cell] = 1 + extra
+        else:
+            self.costs.pop(cell, None)
+        self.log.append(cell)
+
+    def cursor(self):
+        """Retorna el número de secuencia del siguiente cambio de costo."""
+        return self.base + len(self.log)
+
+    def changes_since(self, cursor):
+        """
+        Retorna las celdas cuyo costo cambió desde cursor.
+
+        Args:
+            cursor (int): Valor previo de cursor().
+
+        Returns:
+            list: Celdas cambiadas, o None si esa parte del registro ya fue descartada.
+        """
+        if cursor < self.base:
+            return None
+        return self.log[cursor - self.base:]
+
+    def trim(self, limit):
+        """
+        Descarta la mitad más antigua del registro si supera limit elementos.
+
+        Los planificadores cuyo cursor queda antes del recorte ya no pueden reparar y recalculan
+        desde cero, por lo que limit debe crecer con el tamaño de la red.
+        """
+        if len(self.log) > limit:
+            dropped = len(self.log) // 2
+            del self.log[:dropped]
+            self.base += dropped
@@ -0,0 +1,188 @@
+"""
+Reto - Movilidad Urbana
+Modelación de Sistemas Multiagentes con Gráficas Computacionales
+28/11/2024
+Francisco José Urquizo Schnaas A01028786
+Gabriel Edid Harari A01782146
+gridlock.py
+"""
+
+from .agent import Car, Traffic_Light  # Agentes que pueden bloquear a un coche
+from .recorder import car_number  # Orden determinista de los coches
+from .pathfinding import HierarchicalPlanner  # Planificador con estado que se deshace tras un rechazo
+
+YIELD_COST = 1000  # Costo de la celda que un coche cede al romper un ciclo
+BACKOFF_BASE = 4  # Pasos de espera antes de la primera replanificación en un bloqueo total
+BACKOFF_MAX = 256  # Espera máxima entre replanificaciones en un bloqueo total
+
+
+class WaitForGraph:
+    """
+    Grafo de espera entre coches para detectar y resolver bloqueos totales (gridlock).
+
+    Cada coche bloqueado espera a lo más a un agente: el coche que ocupa su siguiente celda o el
+    semáforo en rojo frente a él. Como cada nodo tiene una sola arista de salida, un ciclo nuevo
+    solo puede cerrarse con la arista recién agregada y basta seguir la cadena desde el coche
+    bloqueado para encontrarlo. Las aristas se invalidan de forma perezosa: una espera solo
+    cuenta si el agente que bloquea sigue en la celda registrada.
+
+    Al encontrar un ciclo, los coches ceden en orden de número (el menor primero): el que cede
+    replanifica con la celda que espera cerrada en el campo de costos. Si ninguno tiene otra
+    ruta, el ciclo queda en bloqueo total junto con los coches formados detrás, y sus
+    replanificaciones por atascamiento y sus cambios de carril se espacian de forma exponencial.
+    """
+
+    def __init__(self, model):
+        """
+        Inicializa el grafo vacío.
+
+        Args:
+            model (CityModel): Modelo con el grid y el campo de costos.
+        """
+        self.model = model
+        self.edges = {}  # Coche -> (agente que lo bloquea, celda en que lo bloquea)
+        self.standstill = {}  # Coche en bloqueo total -> [paso de la siguiente replanificación, intervalo]
+        self.cycles_found = 0  # Ciclos detectados
+        self.cycles_resolved = 0  # Ciclos rotos cediendo una celda
+        self.replans_skipped = 0  # Replanificaciones evitadas por la espera exponencial
+
+    def blocker_at(self, car, cell):
+        """Retorna el coche o semáforo en rojo que impide entrar a una celda, o None."""
+        for agent in self.model.grid.get_cell_list_contents(cell):
+            if isinstance(agent, Car) and agent is not car:
+                return agent
+            if isinstance(agent, Traffic_Light) and not agent.state:
+                return agent
+        return None
+
+    def waits_on(self, car):
+        """Retorna el agente al que espera un coche si la espera sigue vigente, o None."""
+        edge = self.edges.get(car)
+        if edge is None:
+            return None
+        blocker, cell = edge
+        if blocker.pos != cell:
+            del self.edges[car]  # El coche que bloqueaba ya se movió
+            return None
+        return blocker
+
+    def block(self, car, cell):
+        """
+        Registra que un coche está bloqueado frente a una celda y busca el ciclo que cierra.
+
+        Args:
+            car (Car): Coche bloqueado.
+            cell (tuple): Celda a la que el coche quiere entrar.
+
+        Returns:
+            Car: Coche que cedió su celda para romper un ciclo, o None.
+        """
+        blocker = self.blocker_at(car, cell)
+        if blocker is None:
+            self.edges.pop(car, None)  # Obstáculo o destino ajeno: no es una espera
+            return None
+        self.edges[car] = (blocker, cell)
+        if not isinstance(blocker, Car):
+            return None
+
+        chain = [car]
+        seen = {car}
+        current = blocker
+        while isinstance(current, Car):
+            if current is car:
+                self.cycles_found += 1
+                yielded = self.resolve(chain)
+                if yielded is None:
+                    for member in chain:
+                        self.enter_standstill(member)
+                return yielded
+            if current in seen:
+                return None  # Ciclo que no pasa por car; se detectó al cerrarse
+            if current in self.standstill:
+                self.enter_standstill(car)  # Formado detrás de un bloqueo total
+                return None
+            chain.append(current)
+            seen.add(current)
+            current = self.waits_on(current)
+        return None
+
+    def resolve(self, cycle):
+        """
+        Rompe un ciclo haciendo que uno de sus coches ceda la celda que espera.
+
+        Args:
+            cycle (list): Coches del ciclo.
+
+        Returns:
+            Car: Coche que encontró una ruta que no pasa por la celda que espera, o None.
+        """
+        field = self.model.cost_field
+        for car in sorted(cycle, key=car_number):
+            blocked = self.edges[car][1]
+            # El plan de prueba no debe cambiar la ruta abstracta del coche si no cede
+            planner = car.planner
+            saved = planner.checkpoint() if isinstance(planner, HierarchicalPlanner) else None
+            field.override(blocked, YIELD_COST)
+            try:
+                path = car.find_path()
+            finally:
+                field.restore(blocked)
+            if path and path[0] != blocked:
+                car.path = path
+                del self.edges[car]
+                self.model.wake(car)  # Puede estar estacionado esperando la celda cerrada
+                self.cycles_resolved += 1
+                return car
+            if saved is not None:
+                planner.rollback(saved)
+            car.planner = planner  # Descarta el planificador creado solo para la prueba
+        return None
+
+    def enter_standstill(self, car):
+        """Marca un coche en bloqueo total y empieza su espera exponencial."""
+        if car not in self.standstill:
+            self.standstill[car] = [self.model.step_count + BACKOFF_BASE, BACKOFF_BASE]
+
+    def may_replan(self, car):
+        """
+        Indica si un coche atascado puede replanificar en este paso.
+
+        Fuera de un bloqueo total siempre puede; dentro, solo cuando vence su espera, que se
+        duplica después de cada intento hasta BACKOFF_MAX.
+        """
+        state = self.standstill.get(car)
+        if state is None:
+            return True
+        if self.model.step_count < state[0]:
+            self.replans_skipped += 1
+            return False
+        state[1] = min(state[1] * 2, BACKOFF_MAX)
+        state[0] = self.model.step_count + state[1]
+        return True
+
+    def park_timeout(self, car, timeout):
+        """Extiende la espera estacionada de un coche en bloqueo total hasta su siguiente replanificación."""
+        state = self.standstill.get(car)
+        if state is None or timeout is None:
+            return timeout
+        return max(timeout, state[0] - self.model.step_count)
+
+    def moved(self, car, pos):
+        """
+        Olvida la espera de un coche que se movió.
+
+        El bloqueo total solo termina si el coche avanzó por su ruta; un cambio de carril lateral
+        dentro del atasco no cuenta como progreso.
+        """
+        self.edges.pop(car, None)
+        if car in self.standstill and car.next_cell() == pos:
+            del self.standstill[car]
+
+    def clear(self, car):
+        """Olvida la espera y el bloqueo total de un coche que salió de la simulación."""
+        self.edges.pop(car, None)
+        self.standstill.pop(car, None)
+
+    def get_standstill_count(self):
+        """Retorna el número de coches en bloqueo total."""
+        return len(self.standstill)
@@ -10,13 +10,31 @@ model.py
 # Importaciones necesarias desde las bibliotecas estándar y la biblioteca Mesa
 import os  # Para interactuar con el sistema operativo, como manejar rutas de archivos
 import json  # Para manejar archivos JSON
-import requests # Para realizar solicitudes HTTP
 import random  # Para generar números aleatorios
+import time  # Para medir el presupuesto de tiempo de la fase de planificación
 from mesa import Model  # Clase base para modelos en Mesa
 from mesa.time import BaseScheduler  # Scheduler básico para gestionar la orden de ejecución de agentes
-from mesa.space import MultiGrid  # Espacio de múltiples agentes por celda
 from mesa.datacollection import DataCollector  # Para recopilar datos durante la simulación
 from .agent import Road, Traffic_Light, Obstacle, Destination, Car  # Importa las clases de agentes definidas localmente
+from .scheduler import EventScheduler, PlanningQueue, PRIORITY_NEW  # Scheduler de coches y cola de planificación de rutas
+from .routes import RouteStore  # Almacén compartido de rutas de los coches
+from .pathfinding import RoadNetwork, ClusterGraph, shared_goal_paths  # Grafos de calles usados por los planificadores
+from .recorder import TraceRecorder  # Grabación de trayectorias en columnas binarias
+from .analytics import CongestionStats, heatmap_response  # Métricas de congestión y respuesta de /heatmap
+from .space import ChunkedGrid  # Grid disperso por bloques (múltiples agentes por celda)
+from .spatial import BucketIndex, StaticIndex  # Índices espaciales para consultas por caja
+from .congestion import CostField  # Campo de costos de congestión compartido por los planificadores
+from .gridlock import WaitForGraph  # Detección de bloqueos totales entre coches
+
+COST_LOG_LIMIT = 4096  # Tamaño mínimo al que se permite crecer el registro de cambios de costo
+COST_LOG_PER_CELL = 8  # Cambios por celda de la red que se conservan antes de recortar el registro
+PLANNERS = ("incremental", "hierarchical", "astar")  # Valores aceptados para el parámetro planner
+
+
+def count_cars(model):
+    """Retorna el número de coches en la simulación (reporte del DataCollector)."""
+    return len(model.cars)
+
 
 class CityModel(Model):
     """ 
@@ -29,10 +47,35 @@ class CityModel(Model):
     Args:
         width (int): Ancho de la cuadrícula.
         height (int): Altura de la cuadrícula.
+        planner (str): Planificador de rutas de los coches ("astar", "incremental" para D* Lite o
+            "hierarchical" para HPA*). Con batch_routes, A* es el más rápido en tiempo: D* Lite
+            expande menos nodos, pero cada expansión y la reparación del registro de costos cuestan
+            más, y la mayoría de las rutas salen de la búsqueda agrupada por destino.
+        cluster_size (int): Lado en celdas de los clusters del planificador jerárquico.
+        batch_routes (bool): Si es True, las rutas de coches nuevos y atascados se resuelven
+            al inicio del paso agrupadas por destino.
+        route_budget (int): Nodos expandidos por paso en la fase de planificación (None sin límite).
+        route_time_budget (float): Milisegundos por paso en la fase de planificación (None sin
+            límite). Con cualquiera de los dos presupuestos todas las rutas pasan por la cola.
+        event_scheduling (bool): Si es True, los coches bloqueados se estacionan hasta que el
+            semáforo cambie o la celda se libere en lugar de activarse en cada paso.
+        analytics (bool): Si es True, se acumulan las métricas de congestión (ocupación,
+            esperas, colas de semáforos y duración de viajes).
+        congestion_decay (float): Suavizado del campo de costos de congestión entre pasos
+            (0 usa solo la ocupación del paso actual).
+        gridlock_detection (bool): Si es True, se detectan los ciclos de coches que se esperan entre
+            sí, se rompen cediendo una celda y se espacian las replanificaciones inútiles.
+        spawn_every (int): Cada cuántos pasos se intentan crear coches nuevos en las posiciones de
+            inicio libres (menos pasos, más coches en la ciudad).
+        verbose (bool): Si es True, se imprime cada evento de los agentes.
     """
-    def __init__(self, width=30, height=30):
+    def __init__(self, width=30, height=30, planner="astar", cluster_size=10, batch_routes=True,
+                 route_budget=None, route_time_budget=None, event_scheduling=True, analytics=True, congestion_decay=0.0, gridlock_detection=True,
+                 spawn_every=10, verbose=True):
         """Inicializa el modelo de la ciudad con las dimensiones especificadas."""
         super().__init__()
+        if planner not in PLANNERS:
+            raise ValueError(f"Planificador desconocido: {planner} (se acepta {', '.join(PLANNERS)})")
 
         # Inicializar listas para diferentes tipos de agentes
         self.traffic_lights = []  # Lista para almacenar semáforos
@@ -47,6 +90,28 @@ class CityModel(Model):
         self.cars_in_sim = 0  # Número actual de coches en la simulación
         self.prev_cars_in_sim = 0  # Número de coches en la simulación en el paso anterior
         self.reached_destinations = 0  # Contador de destinos alcanzados
+        self.verbose = verbose  # Imprimir los eventos de cada agente
+        self.collect_every = 1  # Cada cuántos pasos se recopilan datos
+        self.spawn_every = spawn_every  # Cada cuántos pasos se crean coches nuevos
+
+        # Estado compartido por los planificadores de rutas
+        self.planner = planner  # Planificador usado por Car.find_path
+        self.cluster_size = cluster_size  # Tamaño de cluster para el planificador jerárquico
+        self.cluster_graph = None  # Grafo abstracto, se construye al primer uso
+        self.route_budget = route_budget  # Nodos expandidos por paso en la fase de planificación
+        self.route_time_budget = route_time_budget  # Milisegundos por paso en la fase de planificación
+        self.route_budgeted = route_budget is not None or route_time_budget is not None
+        self.batch_routes = batch_routes or self.route_budgeted  # Agrupar las búsquedas de ruta de cada paso
+        self.route_queue = PlanningQueue()  # Coches que esperan ruta en la fase de planificación
+        self.expansions = 0  # Nodos expandidos por todos los planificadores
+        self.event_scheduling = event_scheduling  # Estacionar coches bloqueados
+        self.car_cells = set()  # Celdas ocupadas actualmente por coches (capa de ocupación)
+        self.cost_field = None  # Campo de costos de congestión, se crea con la red de calles
+        self.gridlock = None  # Grafo de espera entre coches (gridlock_detection)
+        self.recorder = None  # Grabador de trayectorias opcional (start_recording)
+        self.stats = None  # Métricas de congestión, se crean con la capa estática
+        self.car_index = BucketIndex()  # Coches por cubeta, se actualiza en cada movimiento
+        self.static_index = None  # Índice de la capa estática, se construye al primer uso
 
         # Obtener la ruta absoluta del directorio actual (donde está model.py)
         current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -90,8 +155,9 @@ class CityModel(Model):
         # Asignar las dimensiones del grid
         self.width = width  # Ancho de la cuadrícula
         self.height = height  # Altura de la cuadrícula
-        self.grid = MultiGrid(self.width, self.height, torus=False)  # Crear una cuadrícula múltiple sin torus
-        self.schedule = BaseScheduler(self)  # Crear un scheduler básico para gestionar los agentes
+        self.grid = ChunkedGrid(self.width, self.height, torus=False)  # Cuadrícula múltiple sin torus, solo reserva los bloques ocupados
+        # Crear el scheduler; EventScheduler conserva el orden de BaseScheduler pero no activa coches estacionados
+        self.schedule = EventScheduler(self) if event_scheduling else BaseScheduler(self)
         """
         El base scheduler se usa para eliminar la arbitrariedad en el movimiento de los coches en los puntos de spawn para que
         no se congestione prematuramente.
@@ -182,10 +248,22 @@ class CityModel(Model):
             self.destinations.append(dest_agent)  # Añadir a la lista de destinos
             print(f"Agente Destination 'd_hardcoded' añadido en {hardcoded_destination}.")
 
+        # Construir el grafo de calles una sola vez para los planificadores
+        self.road_network = RoadNetwork(self)
+        self.cost_field = CostField(self.road_network, congestion_decay)
+        # El registro crece con la red: reparar un rezago de varias veces la red ya cuesta lo mismo
+        # que recalcular, así que solo los planificadores con un rezago así recalculan desde cero
+        self.cost_log_limit = max(COST_LOG_LIMIT, COST_LOG_PER_CELL * len(self.cost_field.cells))
+        if gridlock_detection:
+            self.gridlock = WaitForGraph(self)
+        self.route_store = RouteStore(self.width)  # Rutas compartidas entre coches
+        if analytics:
+            self.stats = CongestionStats(self)
+
         # Configurar DataCollector para recopilar información durante la simulación
         self.datacollector = DataCollector(
             model_reporters={
-                "Cars_in_sim": lambda model: len(model.cars),  # Número de coches en la simulación
+                "Cars_in_sim": count_cars,  # Función de módulo para que el modelo se pueda serializar
             }
         )
 
@@ -207,6 +285,236 @@ class CityModel(Model):
         """
         return self.reached_destinations
 
+    def move_cost(self, pos):
+        """
+        Retorna el costo de entrar a una celda para los planificadores de rutas.
+
+        Args:
+            pos (tuple): Coordenadas (x, y) de la celda.
+
+        Returns:
+            int: Costo de la celda en el campo de congestión del paso actual.
+        """
+        return self.cost_field.costs.get(pos, 1)
+
+    def get_cluster_graph(self):
+        """Retorna el grafo abstracto del planificador jerárquico, construyéndolo al primer uso."""
+        if self.cluster_graph is None:
+            self.cluster_graph = ClusterGraph(self.road_network, self.cluster_size)
+        return self.cluster_graph
+
+    def request_route(self, car, priority):
+        """
+        Encola un coche para que reciba ruta en la fase de planificación.
+
+        El coche conserva su ruta actual (o espera sin moverse si no tiene) hasta que se le atienda.
+
+        Args:
+            car (Car): Coche que pide ruta.
+            priority (int): Prioridad de la solicitud (PRIORITY_NEW, PRIORITY_STUCK o PRIORITY_REFRESH).
+        """
+        self.route_queue.push(car, priority, self.step_count)
+
+    def route_pending(self, car):
+        """Indica si un coche espera ruta en la cola de planificación."""
+        return car in self.route_queue
+
+    def route_budget_spent(self, start_time, start_expansions):
+        """Indica si la fase de planificación ya agotó el presupuesto del paso."""
+        if self.route_budget is not None and self.expansions - start_expansions >= self.route_budget:
+            return True
+        if self.route_time_budget is not None:
+            return (time.perf_counter() - start_time) * 1000 >= self.route_time_budget
+        return False
+
+    def plan_routes(self):
+        """
+        Fase de planificación: resuelve las rutas pendientes antes de que los coches se muevan.
+
+        Las solicitudes se atienden por prioridad (coches sin ruta, luego atascados, luego rutas
+        parciales agotadas) hasta agotar el presupuesto del paso; siempre se atiende al menos un
+        grupo para que la cola avance. Cada coche atendido se agrupa con los que esperan ruta hacia
+        su mismo destino: un grupo de dos o más se resuelve con una sola búsqueda inversa desde el
+        destino y un coche solitario usa su propio planificador. Los que no alcanzan presupuesto
+        siguen en la cola para el siguiente paso.
+        """
+        queue = self.route_queue
+        start_time = time.perf_counter()
+        start_expansions = self.expansions
+        served = False
+        while queue:
+            if served and self.route_budget_spent(start_time, start_expansions):
+                break
+            car = queue.pop()
+            cars = [other for other in [car] + queue.take_goal(car.destination_pos) if other.pos is not None]
+            if not cars:
+                continue
+            served = True
+            if len(cars) == 1:
+                cars[0].path = cars[0].find_path()
+                continue
+            paths, expanded = shared_goal_paths(self.road_network, car.destination_pos,
+                                                [other.pos for other in cars], self.move_cost)
+            self.expansions += expanded
+            for other in cars:
+                other.path = paths[other.pos]
+
+    def note_blocked(self, car, cell):
+        """
+        Registra que un coche está bloqueado frente a una celda (métricas y grafo de espera).
+
+        Returns:
+            bool: True si el coche cedió la celda para romper un ciclo y ya tiene otra ruta.
+        """
+        if self.stats is not None:
+            self.stats.block(car, cell, self.step_count)
+        if self.gridlock is not None:
+            return self.gridlock.block(car, cell) is car
+        return False
+
+    def note_unblocked(self, car):
+        """Registra que un coche que no se movió ya no está bloqueado (cierra su espera)."""
+        if self.stats is not None:
+            self.stats.unblock(car, self.step_count)
+
+    def may_replan(self, car):
+        """Indica si un coche atascado puede replanificar (espera exponencial en bloqueos totales)."""
+        return self.gridlock is None or self.gridlock.may_replan(car)
+
+    def heatmap(self):
+        """
+        Retorna las métricas de congestión acumuladas hasta el paso actual.
+
+        Returns:
+            dict: Arreglos de NumPy de CongestionStats.snapshot, o None si están desactivadas.
+        """
+        if self.stats is None:
+            return None
+        return self.stats.snapshot(self.step_count)
+
+    def heatmap_payload(self, encoding="list"):
+        """
+        Retorna las métricas de congestión en el formato de respuesta de /heatmap.
+
+        Args:
+            encoding (str): "list" o "base64" (ver heatmap_response).
+
+        Returns:
+            dict: Respuesta de /heatmap, o None si las métricas están desactivadas.
+        """
+        stats = self.heatmap()
+        if stats is None:
+            return None
+        lights = [(str(light.unique_id), light.pos[0], light.pos[1]) for light in self.stats.lights]
+        destinations = [(str(destination.unique_id), destination.pos[0], destination.pos[1])
+                        for destination in self.stats.destinations]
+        return heatmap_response(stats, self.step_count, self.width, self.height, lights, destinations, encoding)
+
+    def wait_on(self, car, cell, timeout=None):
+        """
+        Estaciona un coche bloqueado hasta que ocurra un evento en la celda que lo bloquea.
+
+        Args:
+            car (Car): Coche bloqueado.
+            cell (tuple): Celda del semáforo o del coche que lo bloquea.
+            timeout (int): Pasos tras los cuales el coche se reactiva aunque no haya evento.
+        """
+        if self.event_scheduling:
+            if self.gridlock is not None:
+                timeout = self.gridlock.park_timeout(car, timeout)
+            self.schedule.park(car, cell, timeout)
+
+    def wake(self, car):
+        """Reactiva a un coche estacionado (por ejemplo, si cambió de ruta)."""
+        if self.event_scheduling:
+            self.schedule.wake(car)
+
+    def notify_cell(self, cell):
+        """Despierta a los coches que esperan un cambio en la celda indicada."""
+        if self.event_scheduling:
+            self.schedule.notify(cell)
+
+    def place_car(self, car, pos):
+        """Coloca un coche en el grid y registra la celda ocupada."""
+        self.grid.place_agent(car, pos)
+        self.car_cells.add(pos)
+        self.car_index.add(car, pos)
+        if self.stats is not None:
+            # Los coches creados en el paso k aparecen en su frame, como los que se mueven durante
+            # ese paso (registrados con step_count = k - 1); los iniciales aparecen antes del
+            # primer paso y no suman ticks hasta que este ocurre
+            step = self.step_count
+            if step > self.stats.start_step:
+                step -= 1
+            self.stats.spawn(car, pos, step)
+
+    def move_car(self, car, pos):
+        """Mueve un coche en el grid y registra las celdas liberada y ocupada."""
+        old_pos = car.pos
+        self.grid.move_agent(car, pos)
+        self.car_cells.discard(old_pos)
+        self.car_cells.add(pos)
+        self.car_index.move(car, old_pos, pos)
+        if self.gridlock is not None:
+            self.gridlock.moved(car, pos)
+        self.notify_cell(old_pos)
+        if self.stats is not None:
+            self.stats.leave(car, old_pos, self.step_count)
+            self.stats.enter(car, pos, self.step_count)
+
+    def remove_car(self, car):
+        """Retira un coche del grid y del scheduler y registra la celda liberada."""
+        old_pos = car.pos
+        car.path = None  # Liberar la ruta compartida
+        car.planner = None  # Liberar el estado de búsqueda (g, rhs y cola) aunque queden referencias al coche
+        self.grid.remove_agent(car)
+        self.schedule.remove(car)
+        self.cars.remove(car)  # Evitar que la lista crezca con coches que ya llegaron
+        self.car_cells.discard(old_pos)
+        self.car_index.remove(car, old_pos)
+        self.route_queue.discard(car)
+        if self.gridlock is not None:
+            self.gridlock.clear(car)
+        self.notify_cell(old_pos)
+        if self.stats is not None:
+            self.stats.arrive(car, old_pos, self.step_count)
+        if self.recorder is not None:
+            self.recorder.record_arrival(car)
+
+    def cars_in_box(self, box):
+        """
+        Retorna los coches dentro de una caja usando el índice por cubetas.
+
+        Args:
+            box (tuple): (min_x, min_z, max_x, max_z) en celdas, inclusiva.
+
+        Returns:
+            list: Coches cuya celda está dentro de la caja.
+        """
+        return self.car_index.query(box)
+
+    def get_static_index(self):
+        """Retorna el índice de la capa estática, construyéndolo al primer uso."""
+        if self.static_index is None:
+            self.static_index = StaticIndex(self)
+        return self.static_index
+
+    def cost_cursor(self):
+        """Retorna el número de secuencia del siguiente cambio en el campo de costos."""
+        return self.cost_field.cursor()
+
+    def cost_changes_since(self, cursor):
+        """
+        Retorna las celdas cuyo costo cambió desde cursor.
+
+        Args:
+            cursor (int): Valor previo de cost_cursor().
+
+        Returns:
+            list: Celdas cambiadas, o None si esa parte del registro ya fue descartada.
+        """
+        return self.cost_field.changes_since(cursor)
+
     def spawn_cars(self, N):
         """
         Crea agentes Car y los asigna a posiciones de inicio disponibles con destinos aleatorios.
@@ -224,7 +532,8 @@ class CityModel(Model):
         ]
 
         if not available_start_positions:
-            print("No hay posiciones de inicio disponibles para spawn de coches.")
+            if self.verbose:
+                print("No hay posiciones de inicio disponibles para spawn de coches.")
             return False
 
         cars_spawned = 0  # Contador de coches creados
@@ -234,7 +543,8 @@ class CityModel(Model):
             if cars_spawned >= N:
                 break  # Salir si ya se han creado suficientes coches
             if len(self.destinations) == 0:
-                print("No hay destinos disponibles para asignar a los coches.")
+                if self.verbose:
+                    print("No hay destinos disponibles para asignar a los coches.")
                 break
             random_destination = random.choice(self.destinations)  # Seleccionar un destino aleatorio
             carAgent = Car(
@@ -243,32 +553,131 @@ class CityModel(Model):
                 destination_pos=(random_destination.pos[0], random_destination.pos[1])
             )
             self.unique_id += 1  # Incrementar el ID único
-            self.grid.place_agent(carAgent, pos)  # Colocar el coche en la cuadrícula
+            self.place_car(carAgent, pos)  # Colocar el coche en la cuadrícula
             self.schedule.add(carAgent)  # Añadir el coche al scheduler
+            if self.batch_routes:
+                self.request_route(carAgent, PRIORITY_NEW)  # La ruta se calcula en la fase de planificación
             self.cars.append(carAgent)  # Añadir el coche a la lista de coches
-            print(f"Coche '{carAgent.unique_id}' creado en {pos} con destino {carAgent.destination_pos}.")
+            if self.verbose:
+                print(f"Coche '{carAgent.unique_id}' creado en {pos} con destino {carAgent.destination_pos}.")
             cars_spawned += 1  # Incrementar el contador de coches creados
 
         self.cars_in_sim += cars_spawned  # Actualizar el número de coches en la simulación
         return cars_spawned > 0  # Retornar True si al menos un coche fue creado
 
+    def snapshot(self):
+        """
+        Retorna el estado visible del modelo: posiciones de coches y estados de semáforos.
+
+        Returns:
+            dict: Paso actual, posiciones de los coches y estado de cada semáforo.
+        """
+        return {
+            "step": self.step_count,
+            "positions": [{
+                "id": str(car.unique_id),
+                "x": car.pos[0],
+                "y": 1,
+                "z": car.pos[1]
+            } for car in self.cars if car.pos is not None],
+            "trafficLights": [{
+                "id": str(light.unique_id),
+                "x": light.pos[0],
+                "y": 1,
+                "z": light.pos[1],
+                "state": light.state
+            } for light in self.traffic_lights if light.pos is not None]
+        }
+
+    def start_recording(self, path, flush_every=256):
+        """
+        Empieza a grabar la trayectoria de la simulación en un directorio de columnas binarias.
+
+        Args:
+            path (str): Directorio de la traza.
+            flush_every (int): Pasos que se acumulan en memoria antes de escribir a disco.
+
+        Returns:
+            TraceRecorder: Grabador conectado al modelo.
+        """
+        self.stop_recording()
+        return TraceRecorder(self, path, flush_every)
+
+    def stop_recording(self):
+        """Termina la grabación en curso, si la hay, y escribe lo pendiente a disco."""
+        if self.recorder is not None:
+            self.recorder.close()
+
+    def run_steps(self, steps, collect_every=None, frame_every=None, verbose=False, encode=None):
+        """
+        Avanza el modelo varios pasos en modo rápido.
+
+        Durante el avance se suprimen los mensajes por agente y la recopilación de datos se hace
+        cada collect_every pasos. Al terminar se restaura la configuración previa.
+
+        Args:
+            steps (int): Número de pasos a avanzar.
+            collect_every (int): Cada cuántos pasos recopilar datos (None conserva el actual).
+            frame_every (int): Cada cuántos pasos guardar un snapshot (None para no guardar).
+            verbose (bool): Imprimir los eventos de los agentes durante el avance.
+            encode (callable): Función que recibe el modelo y codifica cada frame (por defecto snapshot).
+
+        Returns:
+            list: Frames tomados cada frame_every pasos.
+
+        Raises:
+            ValueError: Si collect_every o frame_every no son mayores que cero.
+        """
+        if (collect_every is not None and collect_every < 1) or (frame_every is not None and frame_every < 1):
+            raise ValueError(f"collect_every y frame_every deben ser mayores que cero: {collect_every}, {frame_every}")
+        previous_verbose, previous_collect = self.verbose, self.collect_every
+        self.verbose = verbose
+        if collect_every is not None:
+            self.collect_every = collect_every
+        frames = []
+        try:
+            for _ in range(steps):
+                self.step()
+                if frame_every is not None and self.step_count % frame_every == 0:
+                    frames.append(encode(self) if encode is not None else self.snapshot())
+        finally:
+            self.verbose, self.collect_every = previous_verbose, previous_collect
+        return frames
+
     def step(self):
         """Avanza el modelo un paso en el tiempo."""
+        # Un solo campo de costos por paso, calculado con la ocupación al inicio del paso
+        self.cost_field.update(self.car_cells)
+
+        # Resolver en grupo las rutas solicitadas antes de mover a los coches
+        if self.route_queue:
+            self.plan_routes()
+
         # Procesar todos los agentes según el scheduler
         self.schedule.step()
         self.step_count += 1  # Incrementar el contador de pasos
 
-        # Recopilar datos para el paso actual
-        self.datacollector.collect(self)
+        # Recortar el registro de costos; los planificadores rezagados recalculan desde cero
+        self.cost_field.trim(self.cost_log_limit)
 
-        # Spawn de coches cada 1 paso (originalmente cada 10 pasos)
-        if self.step_count % 10 == 0:
+        # Recopilar datos para el paso actual (diezmado en modo rápido)
+        if self.step_count % self.collect_every == 0:
+            self.datacollector.collect(self)
+
+        # Spawn de coches cada spawn_every pasos (10 por defecto)
+        if self.step_count % self.spawn_every == 0:
             cars_spawned = self.spawn_cars(4)  # Intentar crear 4 coches
             if not cars_spawned:
-                print("No se pueden generar más coches en este paso.")
+                if self.verbose:
+                    print("No se pueden generar más coches en este paso.")
                 self.running = False  # Detener la simulación si no se pueden crear más coches
+
+        # Grabar el estado del paso (incluye los coches recién creados)
+        if self.recorder is not None:
+            self.recorder.record_step()
                 
         # Publicar al servidor de la competencia cada 10 pasos
+        # (requiere import requests, que ya no se carga al importar el modelo)
         # if self.step_count % 10 == 0:
         #     url = "http://10.49.12.55:5000/api/"
         #     endpoint = "attempt"
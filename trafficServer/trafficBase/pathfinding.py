@@ -0,0 +1,677 @@
+"""
+Reto - Movilidad Urbana
+Modelación de Sistemas Multiagentes con Gráficas Computacionales
+28/11/2024
+Francisco José Urquizo Schnaas A01028786
+Gabriel Edid Harari A01782146
+pathfinding.py
+"""
+
+# Importaciones necesarias desde las bibliotecas estándar
+import heapq  # Para implementar la cola de prioridad de los planificadores
+
+INF = float("inf")  # Costo de una celda inalcanzable
+
+# Dirección de carretera que prohíbe cada movimiento (se entraría en sentido contrario)
+OPPOSITE_DIRECTION = {
+    (1, 0): "Left",
+    (-1, 0): "Right",
+    (0, 1): "Down",
+    (0, -1): "Up",
+}
+
+
+def manhattan(a, b):
+    """
+    Calcula la distancia Manhattan entre dos puntos.
+
+    Args:
+        a (tuple): Coordenadas (x, y) del primer punto.
+        b (tuple): Coordenadas (x, y) del segundo punto.
+
+    Returns:
+        int: Distancia Manhattan entre los dos puntos.
+    """
+    return abs(a[0] - b[0]) + abs(a[1] - b[1])
+
+
+class RoadNetwork:
+    """
+    Grafo estático y dirigido de las celdas transitables de la ciudad.
+
+    Se construye una sola vez a partir del grid del modelo con las mismas reglas que usa
+    el A* de Car: se puede entrar a una carretera o semáforo siempre que no sea en sentido
+    contrario, y solo se puede entrar al destino propio. Los destinos se guardan aparte
+    porque cada coche únicamente puede usar el suyo.
+    """
+
+    def __init__(self, model):
+        """
+        Construye el grafo recorriendo una vez el grid del modelo.
+
+        Args:
+            model (CityModel): Modelo con el grid ya poblado.
+        """
+        # Importación local para evitar el ciclo agent -> pathfinding -> agent
+        from .agent import Road, Traffic_Light, Destination
+
+        grid = model.grid
+        self.width = grid.width
+        self.height = grid.height
+        self.cells = set()  # Celdas de carretera o semáforo
+        self.direction = {}  # Dirección de la carretera en cada celda (si la tiene)
+        self.destinations = set()  # Celdas de destino
+        self.succ = {}  # Sucesores estáticos de cada celda transitable
+        self.pred = {}  # Predecesores estáticos de cada celda transitable
+        self.dest_pred = {}  # Celdas desde las que se puede entrar a cada destino
+
+        lights = []
+        for contents, (x, y) in grid.coord_iter():
+            pos = (x, y)
+            for agent in contents:
+                if isinstance(agent, Road):
+                    self.direction[pos] = agent.direction
+                elif isinstance(agent, Traffic_Light):
+                    lights.append(pos)
+            if any(isinstance(agent, Destination) for agent in contents):
+                self.destinations.add(pos)
+            elif any(isinstance(agent, (Road, Traffic_Light)) for agent in contents):
+                self.cells.add(pos)
+
+        # Los semáforos están sobre una calle: heredan su sentido para que no se crucen de frente
+        for pos in lights:
+            direction = self.infer_direction(pos)
+            if direction is not None:
+                self.direction[pos] = direction
+
+        for cell in self.cells:
+            self.succ[cell] = []
+            self.pred.setdefault(cell, [])
+        for destination in self.destinations:
+            self.dest_pred[destination] = []
+
+        for cell in self.cells:
+            for neighbor in self.neighbors(cell):
+                if not self.can_enter(cell, neighbor):
+                    continue
+                if neighbor in self.cells:
+                    self.succ[cell].append(neighbor)
+                    self.pred[neighbor].append(cell)
+                elif neighbor in self.destinations:
+                    self.dest_pred[neighbor].append(cell)
+
+    def infer_direction(self, pos):
+        """
+        Deduce el sentido de una celda sin dirección (un semáforo) a partir de la calle en que está.
+
+        Se recorre cada eje desde la celda hasta encontrar una carretera cuyo sentido vaya sobre ese
+        mismo eje; las carreteras perpendiculares (cruces) se saltan y una celda no transitable
+        detiene la búsqueda.
+
+        Args:
+            pos (tuple): Coordenadas (x, y) de la celda.
+
+        Returns:
+            str: Dirección deducida, o None si no se puede determinar.
+        """
+        axes = (
+            (((0, 1), (0, -1)), ("Up", "Down")),
+            (((1, 0), (-1, 0)), ("Left", "Right")),
+        )
+        for steps, directions in axes:
+            for dx, dy in steps:
+                x, y = pos[0] + dx, pos[1] + dy
+                while 0 <= x < self.width and 0 <= y < self.height and (x, y) in self.cells:
+                    direction = self.direction.get((x, y))
+                    if direction in directions:
+                        return direction
+                    x, y = x + dx, y + dy
+        return None
+
+    def neighbors(self, pos):
+        """
+        Retorna los vecinos de von Neumann de una celda dentro de los límites del grid.
+
+        Args:
+            pos (tuple): Coordenadas (x, y) de la celda.
+
+        Returns:
+            list: Coordenadas de las celdas vecinas.
+        """
+        x, y = pos
+        return [
+            (nx, ny) for nx, ny in ((x, y + 1), (x - 1, y), (x + 1, y), (x, y - 1))
+            if 0 <= nx < self.width and 0 <= ny < self.height
+        ]
+
+    def can_enter(self, current, neighbor):
+        """
+        Verifica que el movimiento de current a neighbor no vaya en sentido contrario.
+
+        Args:
+            current (tuple): Celda de origen.
+            neighbor (tuple): Celda de destino del movimiento.
+
+        Returns:
+            bool: True si el movimiento respeta la dirección de la carretera.
+        """
+        move = (neighbor[0] - current[0], neighbor[1] - current[1])
+        return self.direction.get(neighbor) != OPPOSITE_DIRECTION.get(move)
+
+    def successors(self, cell, goal):
+        """
+        Retorna las celdas a las que un coche con destino goal puede moverse desde cell.
+
+        Args:
+            cell (tuple): Celda de origen.
+            goal (tuple): Destino del coche.
+
+        Returns:
+            list: Celdas sucesoras.
+        """
+        successors = self.succ.get(cell, [])
+        if cell in self.dest_pred.get(goal, ()):
+            return successors + [goal]
+        return successors
+
+    def predecessors(self, cell, goal):
+        """
+        Retorna las celdas desde las que un coche con destino goal puede llegar a cell.
+
+        Args:
+            cell (tuple): Celda de llegada.
+            goal (tuple): Destino del coche.
+
+        Returns:
+            list: Celdas predecesoras.
+        """
+        if cell == goal and cell in self.dest_pred:
+            return self.dest_pred[cell]
+        return self.pred.get(cell, [])
+
+
+class DStarLite:
+    """
+    Planificador incremental D* Lite para un coche con destino fijo.
+
+    La búsqueda se hace desde el destino hacia el coche y conserva sus valores g/rhs entre
+    llamadas. Cuando el coche se mueve solo se ajusta km, y cuando cambia el costo de
+    celdas ya exploradas solo se reparan los vértices afectados en lugar de volver a buscar
+    desde cero.
+    """
+
+    def __init__(self, model, goal):
+        """
+        Inicializa el planificador para un destino.
+
+        Args:
+            model (CityModel): Modelo que provee la red de calles, costos y registro de cambios de costo.
+            goal (tuple): Coordenadas (x, y) del destino.
+        """
+        self.model = model
+        self.network = model.road_network
+        self.goal = goal
+        self.start = None  # Posición del coche en la última planificación
+        self.km = 0  # Corrección acumulada de la heurística por el movimiento del coche
+        self.g = {}
+        self.rhs = {}
+        self.open = []  # Cola de prioridad con borrado perezoso
+        self.keys = {}  # Llave vigente de cada celda en la cola
+        self.cursor = None  # Posición en el registro de costos ya procesada
+        self.expansions = 0  # Nodos expandidos (para medir el trabajo de planificación)
+
+    def reset(self, start):
+        """Descarta el estado de búsqueda y lo inicializa desde el destino."""
+        self.start = start
+        self.km = 0
+        self.g = {}
+        self.rhs = {self.goal: 0}
+        self.open = []
+        self.keys = {}
+        self.push(self.goal)
+
+    def calculate_key(self, cell):
+        """Calcula la llave de prioridad de una celda."""
+        best = min(self.g.get(cell, INF), self.rhs.get(cell, INF))
+        return (best + manhattan(self.start, cell) + self.km, best)
+
+    def push(self, cell):
+        """Inserta o actualiza una celda en la cola de prioridad."""
+        key = self.calculate_key(cell)
+        self.keys[cell] = key
+        heapq.heappush(self.open, (key, cell))
+
+    def top_key(self):
+        """Retorna la llave mínima vigente de la cola, descartando entradas obsoletas."""
+        while self.open:
+            key, cell = self.open[0]
+            if self.keys.get(cell) == key:
+                return key
+            heapq.heappop(self.open)
+        return (INF, INF)
+
+    def best_rhs(self, cell):
+        """Recalcula rhs de una celda a partir de sus sucesores."""
+        best = INF
+        for successor in self.network.successors(cell, self.goal):
+            g = self.g.get(successor, INF)
+            if g < INF:
+                best = min(best, self.model.move_cost(successor) + g)
+        return best
+
+    def update_vertex(self, cell):
+        """Ajusta la presencia de una celda en la cola según sea consistente o no."""
+        if self.g.get(cell, INF) != self.rhs.get(cell, INF):
+            self.push(cell)
+        else:
+            self.keys.pop(cell, None)
+
+    def compute_shortest_path(self):
+        """Expande celdas hasta que la posición del coche sea consistente."""
+        start = self.start
+        while (self.top_key() < self.calculate_key(start)
+               or self.rhs.get(start, INF) != self.g.get(start, INF)):
+            if not self.open:
+                break
+            old_key, cell = heapq.heappop(self.open)
+            del self.keys[cell]
+            self.expansions += 1
+            new_key = self.calculate_key(cell)
+            if old_key < new_key:
+                self.push(cell)
+            elif self.g.get(cell, INF) > self.rhs.get(cell, INF):
+                self.g[cell] = self.rhs[cell]
+                cost = self.model.move_cost(cell) + self.g[cell]
+                for predecessor in self.network.predecessors(cell, self.goal):
+                    if cost < self.rhs.get(predecessor, INF):
+                        self.rhs[predecessor] = cost
+                        self.update_vertex(predecessor)
+            else:
+                self.g[cell] = INF
+                for affected in self.network.predecessors(cell, self.goal) + [cell]:
+                    if affected != self.goal:
+                        self.rhs[affected] = self.best_rhs(affected)
+                    self.update_vertex(affected)
+
+    def repair(self, cells):
+        """
+        Repara los vértices cuyos costos de salida cambiaron.
+
+        Args:
+            cells (iterable): Celdas cuyo costo cambió desde la última planificación.
+        """
+        for cell in set(cells):
+            if self.g.get(cell, INF) == INF:
+                continue  # Ningún rhs depende de una celda no resuelta
+            for predecessor in self.network.predecessors(cell, self.goal):
+                if predecessor != self.goal:
+                    self.rhs[predecessor] = self.best_rhs(predecessor)
+                    self.update_vertex(predecessor)
+
+    def plan(self, start):
+        """
+        Calcula o repara la ruta desde start hasta el destino.
+
+        Args:
+            start (tuple): Posición actual del coche.
+
+        Returns:
+            list: Ruta hacia el destino excluyendo la posición actual, o lista vacía si no existe.
+        """
+        changes = None
+        if self.start is not None and self.cursor is not None:
+            changes = self.model.cost_changes_since(self.cursor)
+
+        if changes is None:
+            self.reset(start)  # Sin estado previo o el registro ya se recortó
+        else:
+            self.km += manhattan(self.start, start)
+            self.start = start
+            self.repair(changes)
+
+        self.compute_shortest_path()
+        self.cursor = self.model.cost_cursor()
+        return self.extract_path()
+
+    def extract_path(self):
+        """Sigue los valores g desde el coche hasta el destino para construir la ruta."""
+        path = []
+        current = self.start
+        visited = {current}
+        while current != self.goal:
+            best, best_cost = None, INF
+            for successor in self.network.successors(current, self.goal):
+                cost = self.model.move_cost(successor) + self.g.get(successor, INF)
+                # En empate se elige la celda menor para que la ruta no dependa del orden de los vecinos
+                if cost < best_cost or (cost == best_cost < INF and successor < best):
+                    best, best_cost = successor, cost
+            if best is None or best in visited:
+                return []
+            path.append(best)
+            visited.add(best)
+            current = best
+        return path
+
+
+def static_cost(pos):
+    """Costo de entrar a una celda ignorando la congestión."""
+    return 1
+
+
+def restricted_search(network, origin, goal, inside, cost, target=None, reverse=False):
+    """
+    Búsqueda de costo uniforme (o A* si hay target) limitada a las celdas donde inside es verdadero.
+
+    Args:
+        network (RoadNetwork): Red de calles.
+        origin (tuple): Celda inicial de la búsqueda.
+        goal (tuple): Destino del coche; define qué celda de destino se puede usar.
+        inside (callable): Predicado que indica si una celda puede expandirse.
+        cost (callable): Costo de entrar a una celda.
+        target (tuple): Celda buscada; si se indica, la búsqueda se detiene al alcanzarla.
+        reverse (bool): Si es True se recorren las aristas en sentido inverso.
+
+    Returns:
+        tuple: (distancias, padres, expansiones) de las celdas alcanzadas.
+    """
+    dist = {origin: 0}
+    parent = {origin: None}
+    open_set = [(0, 0, origin)]
+    closed = set()
+    while open_set:
+        _, d, cell = heapq.heappop(open_set)
+        if cell in closed:
+            continue
+        closed.add(cell)
+        if cell == target:
+            break
+        if cell != origin and (cell == goal or not inside(cell)):
+            continue  # Se alcanza pero no se expande fuera de la región
+        if reverse:
+            neighbors = network.predecessors(cell, goal)
+        else:
+            neighbors = network.successors(cell, goal)
+        for neighbor in neighbors:
+            step = cost(cell) if reverse else cost(neighbor)
+            tentative = d + step
+            if tentative < dist.get(neighbor, INF):
+                dist[neighbor] = tentative
+                parent[neighbor] = cell
+                h = manhattan(neighbor, target) if target is not None else 0
+                heapq.heappush(open_set, (tentative + h, tentative, neighbor))
+    return dist, parent, len(closed)
+
+
+def shared_goal_paths(network, goal, starts, cost):
+    """
+    Resuelve con una sola búsqueda inversa las rutas de varios coches hacia el mismo destino.
+
+    La búsqueda parte del destino siguiendo las aristas en sentido inverso y se detiene en cuanto
+    todas las posiciones de inicio quedan resueltas.
+
+    Args:
+        network (RoadNetwork): Red de calles.
+        goal (tuple): Destino común.
+        starts (list): Posiciones actuales de los coches.
+        cost (callable): Costo de entrar a una celda.
+
+    Returns:
+        tuple: (rutas, expansiones), con rutas como posición de inicio -> ruta excluyendo esa
+            posición (lista vacía si no hay ruta).
+    """
+    pending = set(starts)
+    dist = {goal: 0}
+    next_cell = {goal: None}  # Siguiente celda hacia el destino
+    open_set = [(0, goal)]
+    closed = set()
+    while open_set and pending:
+        d, cell = heapq.heappop(open_set)
+        if cell in closed:
+            continue
+        closed.add(cell)
+        pending.discard(cell)
+        step = cost(cell)
+        for predecessor in network.predecessors(cell, goal):
+            tentative = d + step
+            if tentative < dist.get(predecessor, INF):
+                dist[predecessor] = tentative
+                next_cell[predecessor] = cell
+                heapq.heappush(open_set, (tentative, predecessor))
+            elif tentative == dist[predecessor] and cell < next_cell[predecessor]:
+                next_cell[predecessor] = cell  # Mismo desempate que DStarLite.extract_path
+
+    paths = {}
+    for start in starts:
+        path = []
+        if start in closed:
+            cell = next_cell[start]
+            while cell is not None:
+                path.append(cell)
+                cell = next_cell[cell]
+        paths[start] = path
+    return paths, len(closed)
+
+
+class ClusterGraph:
+    """
+    Grafo abstracto para búsqueda jerárquica (HPA*).
+
+    La ciudad se divide en clusters cuadrados. Cada arista de la red que cruza de un cluster a
+    otro convierte a sus extremos en nodos de transición, y dentro de cada cluster se
+    precalculan las distancias entre sus transiciones. Las distancias abstractas usan el costo
+    estático; la congestión solo se considera al refinar los tramos.
+    """
+
+    def __init__(self, network, size=10):
+        """
+        Construye el grafo abstracto.
+
+        Args:
+            network (RoadNetwork): Red de calles de la ciudad.
+            size (int): Lado de cada cluster en celdas.
+        """
+        self.network = network
+        self.size = size
+        self.edges = {}  # Nodo de transición -> lista de (vecino, costo)
+        self.by_cluster = {}  # Cluster -> nodos de transición que contiene
+        self.goal_cache = {}  # Destino -> distancias desde las transiciones cercanas
+
+        for cell in network.cells:
+            for neighbor in network.succ[cell]:
+                if self.cluster(cell) != self.cluster(neighbor):
+                    self.add_node(cell)
+                    self.add_node(neighbor)
+                    self.edges[cell].append((neighbor, 1))
+
+        for cluster, nodes in self.by_cluster.items():
+            inside = self.region({cluster})
+            for node in nodes:
+                dist, _, _ = restricted_search(network, node, None, inside, static_cost)
+                for other in nodes:
+                    if other != node and other in dist:
+                        self.edges[node].append((other, dist[other]))
+
+    def cluster(self, cell):
+        """Retorna el cluster al que pertenece una celda."""
+        return (cell[0] // self.size, cell[1] // self.size)
+
+    def add_node(self, cell):
+        """Registra una celda como nodo de transición."""
+        if cell not in self.edges:
+            self.edges[cell] = []
+            self.by_cluster.setdefault(self.cluster(cell), []).append(cell)
+
+    def region(self, clusters):
+        """Retorna un predicado que indica si una celda pertenece a alguno de los clusters dados."""
+        return lambda cell: self.cluster(cell) in clusters
+
+    def goal_region(self, goal):
+        """Retorna los clusters del destino y de las celdas desde las que se entra a él."""
+        clusters = {self.cluster(goal)}
+        clusters.update(self.cluster(cell) for cell in self.network.dest_pred.get(goal, ()))
+        return clusters
+
+    def goal_distances(self, goal):
+        """
+        Retorna las distancias de las transiciones cercanas al destino, compartidas entre coches.
+
+        Args:
+            goal (tuple): Destino.
+
+        Returns:
+            dict: Nodo de transición -> distancia hasta el destino.
+        """
+        if goal not in self.goal_cache:
+            inside = self.region(self.goal_region(goal))
+            dist, _, _ = restricted_search(self.network, goal, goal, inside, static_cost, reverse=True)
+            self.goal_cache[goal] = {cell: d for cell, d in dist.items() if cell in self.edges}
+        return self.goal_cache[goal]
+
+
+class HierarchicalPlanner:
+    """
+    Planificador jerárquico para un coche con destino fijo.
+
+    Planea sobre el grafo abstracto y solo refina a nivel de celdas los siguientes tramos de la
+    ruta, unos pocos clusters por delante del coche. La ruta abstracta se conserva para continuar
+    el refinamiento cuando el coche consume el tramo ya refinado.
+    """
+
+    def __init__(self, model, goal, lookahead=2):
+        """
+        Inicializa el planificador.
+
+        Args:
+            model (CityModel): Modelo que provee el grafo abstracto y los costos.
+            goal (tuple): Coordenadas (x, y) del destino.
+            lookahead (int): Número de cruces entre clusters que se refinan por llamada.
+        """
+        self.model = model
+        self.graph = model.get_cluster_graph()
+        self.network = self.graph.network
+        self.goal = goal
+        self.lookahead = lookahead
+        self.route = []  # Nodos abstractos pendientes de refinar
+        self.anchor = None  # Celda donde termina el último tramo refinado
+        self.expansions = 0  # Nodos expandidos (para medir el trabajo de planificación)
+
+    def abstract_search(self, start):
+        """
+        Busca la ruta abstracta desde start hasta el destino.
+
+        Args:
+            start (tuple): Posición actual del coche.
+
+        Returns:
+            list: Nodos abstractos a recorrer terminando en el destino, o lista vacía.
+        """
+        graph = self.graph
+        goal = self.goal
+        goal_dist = graph.goal_distances(goal)
+
+        # Conectar el inicio con las transiciones de su cluster (y con el destino si está cerca)
+        inside = graph.region({graph.cluster(start)})
+        start_dist, _, expanded = restricted_search(self.network, start, goal, inside, static_cost)
+        self.expansions += expanded
+        start_edges = [(cell, d) for cell, d in start_dist.items() if cell in graph.edges and cell != start]
+        start_edges.extend(graph.edges.get(start, ()))
+        if goal in start_dist:
+            start_edges.append((goal, start_dist[goal]))
+        if start in goal_dist:
+            start_edges.append((goal, goal_dist[start]))
+
+        open_set = [(manhattan(start, goal), 0, start)]
+        best = {start: 0}
+        parent = {start: None}
+        closed = set()
+        while open_set:
+            _, g, node = heapq.heappop(open_set)
+            if node in closed:
+                continue
+            closed.add(node)
+            self.expansions += 1
+            if node == goal:
+                route = []
+                while node != start:
+                    route.append(node)
+                    node = parent[node]
+                return route[::-1]
+            if node == start:
+                edges = start_edges
+            else:
+                edges = list(graph.edges[node])
+                if node in goal_dist:
+                    edges.append((goal, goal_dist[node]))
+            for neighbor, cost in edges:
+                tentative = g + cost
+                if tentative < best.get(neighbor, INF):
+                    best[neighbor] = tentative
+                    parent[neighbor] = node
+                    heapq.heappush(open_set, (tentative + manhattan(neighbor, goal), tentative, neighbor))
+        return []
+
+    def refine(self, origin, target):
+        """
+        Convierte un tramo abstracto en celdas usando los costos actuales del modelo.
+
+        Args:
+            origin (tuple): Celda de inicio del tramo.
+            target (tuple): Celda final del tramo.
+
+        Returns:
+            list: Celdas del tramo excluyendo origin, o lista vacía si no se encontró.
+        """
+        graph = self.graph
+        if target in self.network.succ.get(origin, ()):
+            return [target]
+        clusters = {graph.cluster(origin), graph.cluster(target)}
+        if target == self.goal:
+            clusters |= graph.goal_region(self.goal)
+        _, parent, expanded = restricted_search(
+            self.network, origin, self.goal, graph.region(clusters), self.model.move_cost, target=target
+        )
+        self.expansions += expanded
+        if target not in parent:
+            return []
+        segment = []
+        while target != origin:
+            segment.append(target)
+            target = parent[target]
+        return segment[::-1]
+
+    def plan(self, start):
+        """
+        Calcula la siguiente parte refinada de la ruta hacia el destino.
+
+        Args:
+            start (tuple): Posición actual del coche.
+
+        Returns:
+            list: Celdas de los próximos clusters de la ruta, o lista vacía si no hay ruta.
+        """
+        if not self.route or start != self.anchor:
+            self.route = self.abstract_search(start)
+
+        path = []
+        current = start
+        crossings = 0
+        while self.route and crossings < self.lookahead:
+            node = self.route.pop(0)
+            segment = self.refine(current, node)
+            if not segment:
+                self.route = []
+                return []
+            if self.graph.cluster(node) != self.graph.cluster(current):
+                crossings += 1
+            path.extend(segment)
+            current = node
+        self.anchor = current
+        return path
+
+    def checkpoint(self):
+        """Retorna el estado de la ruta abstracta para deshacer un plan de prueba con rollback."""
+        return list(self.route), self.anchor
+
+    def rollback(self, state):
+        """Restaura el estado guardado con checkpoint."""
+        self.route, self.anchor = state
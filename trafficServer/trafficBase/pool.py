@@ -0,0 +1,202 @@
+"""
+Reto - Movilidad Urbana
+Modelación de Sistemas Multiagentes con Gráficas Computacionales
+28/11/2024
+Francisco José Urquizo Schnaas A01028786
+Gabriel Edid Harari A01782146
+pool.py
+"""
+
+# Importaciones necesarias desde las bibliotecas estándar
+import threading  # Para proteger el estado del pool entre hilos
+from collections import OrderedDict, deque  # Configuraciones en orden de uso y cola de modelos listos
+from concurrent.futures import ThreadPoolExecutor  # Hilos que construyen modelos en segundo plano
+
+from .model import PLANNERS  # Planificadores aceptados por CityModel
+
+# Parámetros de /init que se pasan a CityModel (y que distinguen los modelos del pool)
+MODEL_CONFIG_KEYS = {
+    "planner": "planner",
+    "clusterSize": "cluster_size",
+    "batchRoutes": "batch_routes",
+    "routeBudget": "route_budget",
+    "routeTimeBudget": "route_time_budget",
+    "eventScheduling": "event_scheduling",
+    "analytics": "analytics",
+    "congestionDecay": "congestion_decay",
+    "gridlockDetection": "gridlock_detection",
+    "spawnEvery": "spawn_every",
+}
+
+
+def model_config(data):
+    """
+    Retorna los argumentos de CityModel incluidos en el cuerpo de una petición /init.
+
+    Raises:
+        ValueError: Si el planificador pedido no existe o spawnEvery no es un entero mayor que cero.
+    """
+    config = {arg: data[key] for key, arg in MODEL_CONFIG_KEYS.items() if key in data}
+    if "planner" in config and config["planner"] not in PLANNERS:
+        raise ValueError(f"Planificador desconocido: {config['planner']} (se acepta {', '.join(PLANNERS)})")
+    if "spawn_every" in config:
+        config["spawn_every"] = positive_int(data, "spawnEvery", 10)
+    return config
+
+
+def positive_int(data, key, default=None):
+    """
+    Lee un parámetro entero mayor que cero del cuerpo de una petición.
+
+    Returns:
+        int: Valor del parámetro, o default si no viene (o es null).
+
+    Raises:
+        ValueError: Si el valor no es un entero o es menor o igual a cero.
+    """
+    value = data.get(key)
+    if value is None:
+        return default
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise ValueError(f"{key} debe ser un entero mayor que cero: {value!r}")
+    try:
+        number = int(value)
+    except ValueError:
+        raise ValueError(f"{key} debe ser un entero mayor que cero: {value!r}") from None
+    if number <= 0:
+        raise ValueError(f"{key} debe ser un entero mayor que cero: {value!r}")
+    return number
+
+
+def update_options(data):
+    """
+    Valida el cuerpo de una petición /update.
+
+    Returns:
+        dict: steps, fastForward, collectEvery y frameEvery (los dos últimos None si no vienen).
+
+    Raises:
+        ValueError: Si steps, collectEvery o frameEvery no son enteros mayores que cero.
+    """
+    return {
+        "steps": positive_int(data, "steps", 1),
+        "fastForward": bool(data.get("fastForward", False)),
+        "collectEvery": positive_int(data, "collectEvery"),
+        "frameEvery": positive_int(data, "frameEvery"),
+    }
+
+
+class ModelPool:
+    """
+    Pool de modelos precalentados por configuración.
+
+    Construir un CityModel (leer el mapa, colocar cientos de agentes y crear los primeros coches)
+    toma decenas de milisegundos. El pool mantiene hasta size modelos listos por cada
+    configuración y los repone en segundo plano, de modo que entregar uno es solo sacarlo de una
+    cola. Si no hay ninguno listo se construye en el momento.
+
+    Las configuraciones precalentadas con warm se conservan siempre; de las demás solo se
+    conservan las max_configs usadas más recientemente, y al exceder el límite se descartan los
+    modelos de la menos reciente.
+    """
+
+    def __init__(self, factory, size=2, workers=1, max_configs=4):
+        """
+        Inicializa el pool vacío.
+
+        Args:
+            factory (callable): Función o clase que construye un modelo a partir de la configuración.
+            size (int): Modelos listos que se mantienen por configuración.
+            workers (int): Hilos dedicados a construir modelos.
+            max_configs (int): Configuraciones no precalentadas que se conservan en el pool.
+        """
+        self.factory = factory
+        self.size = size
+        self.max_configs = max_configs
+        self.ready = OrderedDict()  # Llave de configuración -> cola de modelos listos, en orden de uso
+        self.pinned = set()  # Llaves precalentadas con warm, que nunca se descartan
+        self.building = {}  # Llave de configuración -> modelos en construcción
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="model-pool")
+
+    @staticmethod
+    def key(config):
+        """Retorna la llave con la que se agrupan los modelos de una configuración."""
+        return tuple(sorted(config.items()))
+
+    def warm(self, **config):
+        """Empieza a construir en segundo plano los modelos de una configuración y la conserva siempre."""
+        key = self.key(config)
+        with self.lock:
+            self.pinned.add(key)
+        self.replenish(key, config)
+
+    def touch(self, key):
+        """
+        Marca una configuración como la usada más recientemente y descarta las que exceden max_configs.
+
+        Se llama con el lock tomado.
+        """
+        self.ready.setdefault(key, deque())
+        self.ready.move_to_end(key)
+        unpinned = [k for k in self.ready if k not in self.pinned]
+        for old in unpinned[:max(0, len(unpinned) - self.max_configs)]:
+            del self.ready[old]  # Los modelos que aún se construyan para ella se descartan en build
+
+    def replenish(self, key, config):
+        """Programa la construcción de los modelos que faltan para llegar a size."""
+        with self.lock:
+            self.touch(key)
+            missing = self.size - len(self.ready.get(key, ())) - self.building.get(key, 0)
+            if missing <= 0:
+                return
+            self.building[key] = self.building.get(key, 0) + missing
+        for _ in range(missing):
+            self.executor.submit(self.build, key, config)
+
+    def build(self, key, config):
+        """Construye un modelo y lo deja listo en la cola de su configuración."""
+        model = None
+        try:
+            model = self.factory(**config)
+        except Exception as e:
+            print(f"Error al precalentar un modelo con {config}: {e}")
+        with self.lock:
+            self.building[key] -= 1
+            if not self.building[key]:
+                del self.building[key]
+            models = self.ready.get(key)
+            if model is not None and models is not None:
+                models.append(model)
+
+    def acquire(self, **config):
+        """
+        Entrega un modelo con la configuración indicada y repone el pool en segundo plano.
+
+        Args:
+            **config: Argumentos con los que se construye el modelo.
+
+        Returns:
+            Model: Modelo recién inicializado, que deja de pertenecer al pool.
+        """
+        key = self.key(config)
+        with self.lock:
+            models = self.ready.get(key)
+            model = models.popleft() if models else None
+        if model is None:
+            model = self.factory(**config)  # Pool vacío: construir en el momento
+        self.replenish(key, config)
+        return model
+
+    def get_ready_count(self, **config):
+        """Retorna el número de modelos listos para una configuración."""
+        with self.lock:
+            return len(self.ready.get(self.key(config), ()))
+
+    def shutdown(self):
+        """Detiene los hilos de construcción y descarta los modelos listos."""
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        with self.lock:
+            self.ready.clear()
+            self.pinned.clear()
+            self.building.clear()
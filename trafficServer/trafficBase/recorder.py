@@ -0,0 +1,322 @@
+"""
+Reto - Movilidad Urbana
+Modelación de Sistemas Multiagentes con Gráficas Computacionales
+28/11/2024
+Francisco José Urquizo Schnaas A01028786
+Gabriel Edid Harari A01782146
+recorder.py
+"""
+
+# Importaciones necesarias desde las bibliotecas estándar
+import os  # Para crear el directorio de la traza
+import sys  # Para registrar el orden de bytes de la máquina
+import json  # Para guardar los metadatos y la capa estática
+import mmap  # Para leer las columnas sin cargarlas en memoria
+import bisect  # Para buscar un paso en el índice
+from array import array  # Buffers compactos de las columnas
+
+TRACE_VERSION = 1
+INDEX_FIELDS = 5  # step, inicio de coches, número de coches, inicio de llegadas, número de llegadas
+
+# Columnas de la traza: nombre de archivo -> código de tipo de array
+COLUMNS = {
+    "index": "Q",  # INDEX_FIELDS enteros por paso
+    "car_id": "I",  # Número de cada coche (unique_id sin el prefijo "car_")
+    "car_x": "H",
+    "car_y": "H",
+    "lights": "B",  # Estados de los semáforos empaquetados en bits, ancho fijo por paso
+    "arrival_id": "I",  # Coches que llegaron a su destino en el paso
+}
+
+
+def car_number(car):
+    """Retorna el número de un coche a partir de su unique_id (car_<n>)."""
+    return int(str(car.unique_id).rsplit("_", 1)[1])
+
+
+class TraceRecorder:
+    """
+    Grabador de trayectorias en un directorio de columnas binarias de ancho fijo.
+
+    En cada paso se agregan las posiciones de los coches, los estados de los semáforos y los
+    coches que llegaron. Cada columna es un archivo con valores de ancho fijo y el archivo index
+    guarda, por paso, dónde empiezan sus registros; así la traza se puede leer con mmap sin
+    cargarla en memoria. meta.json guarda la capa estática del mapa para poder servirla sin
+    instanciar CityModel.
+    """
+
+    def __init__(self, model, path, flush_every=256):
+        """
+        Crea la traza, guarda los metadatos y graba el estado actual como primer paso.
+
+        Args:
+            model (CityModel): Modelo a grabar.
+            path (str): Directorio de la traza (se crea si no existe; se sobrescribe su contenido).
+            flush_every (int): Pasos que se acumulan en memoria antes de escribir a disco.
+        """
+        self.model = model
+        self.path = path
+        self.flush_every = flush_every
+        self.light_bytes = (len(model.traffic_lights) + 7) // 8
+        self.cars_written = 0  # Registros de coches ya grabados (incluye los del buffer)
+        self.arrivals_written = 0
+        self.pending_arrivals = array("I")  # Llegadas del paso en curso
+        self.buffered_steps = 0
+
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, "meta.json"), "w") as f:
+            json.dump(self.metadata(), f)
+        self.files = {name: open(os.path.join(path, name + ".bin"), "wb") for name in COLUMNS}
+        self.buffers = {name: array(code) for name, code in COLUMNS.items()}
+
+        model.recorder = self
+        self.record_step()
+
+    def metadata(self):
+        """Construye los metadatos de la traza, incluyendo la capa estática del mapa."""
+        model = self.model
+
+        def cells(agents):
+            return [[str(agent.unique_id), agent.pos[0], agent.pos[1]] for agent in agents if agent.pos is not None]
+
+        return {
+            "version": TRACE_VERSION,
+            "byteorder": sys.byteorder,
+            "columns": COLUMNS,
+            "width": model.width,
+            "height": model.height,
+            "light_bytes": self.light_bytes,
+            "car_prefix": "car_",
+            "roads": [[str(road.unique_id), road.pos[0], road.pos[1], road.direction] for road in model.roads],
+            "obstacles": cells(model.obstacles),
+            "destinations": cells(model.destinations),
+            "traffic_lights": cells(model.traffic_lights),
+        }
+
+    def record_arrival(self, car):
+        """Registra que un coche llegó a su destino en el paso en curso."""
+        self.pending_arrivals.append(car_number(car))
+
+    def record_step(self):
+        """Agrega el estado actual del modelo como un paso de la traza."""
+        buffers = self.buffers
+        cars = [car for car in self.model.cars if car.pos is not None]
+        buffers["car_id"].extend(car_number(car) for car in cars)
+        buffers["car_x"].extend(car.pos[0] for car in cars)
+        buffers["car_y"].extend(car.pos[1] for car in cars)
+
+        bits = 0
+        for i, light in enumerate(self.model.traffic_lights):
+            if light.state:
+                bits |= 1 << i
+        buffers["lights"].frombytes(bits.to_bytes(self.light_bytes, "little"))
+
+        buffers["index"].extend((
+            self.model.step_count,
+            self.cars_written, len(cars),
+            self.arrivals_written, len(self.pending_arrivals),
+        ))
+        buffers["arrival_id"].extend(self.pending_arrivals)
+        self.cars_written += len(cars)
+        self.arrivals_written += len(self.pending_arrivals)
+        self.pending_arrivals = array("I")
+
+        self.buffered_steps += 1
+        if self.buffered_steps >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        """Escribe a disco los pasos acumulados en memoria."""
+        for name, buffer in self.buffers.items():
+            buffer.tofile(self.files[name])
+            self.files[name].flush()
+            self.buffers[name] = array(COLUMNS[name])
+        self.buffered_steps = 0
+
+    def close(self):
+        """Escribe lo pendiente, cierra los archivos y desconecta el grabador del modelo."""
+        self.flush()
+        for f in self.files.values():
+            f.close()
+        if self.model.recorder is self:
+            self.model.recorder = None
+
+
+class TraceReader:
+    """
+    Lector de una traza grabada por TraceRecorder.
+
+    Cada columna se abre con mmap, de modo que leer cualquier paso solo toca las páginas de
+    ese paso.
+    """
+
+    def __init__(self, path):
+        """
+        Abre una traza.
+
+        Args:
+            path (str): Directorio de la traza.
+        """
+        self.path = path
+        with open(os.path.join(path, "meta.json")) as f:
+            self.meta = json.load(f)
+        if self.meta["byteorder"] != sys.byteorder:
+            raise ValueError(f"La traza {path} se grabó con orden de bytes {self.meta['byteorder']}.")
+        self.maps = {}
+        self.columns = {}
+        for name, code in self.meta["columns"].items():
+            with open(os.path.join(path, name + ".bin"), "rb") as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    self.columns[name] = memoryview(array(code))
+                    continue
+                self.maps[name] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self.columns[name] = memoryview(self.maps[name]).cast(code)
+        self.steps = self.columns["index"][::INDEX_FIELDS]  # Número de paso de cada registro
+
+    def __len__(self):
+        """Retorna el número de pasos grabados."""
+        return len(self.steps)
+
+    def find(self, step):
+        """
+        Retorna la posición en la traza del último paso grabado que no es posterior a step.
+
+        Args:
+            step (int): Número de paso de la simulación.
+
+        Returns:
+            int: Posición del registro en la traza.
+        """
+        i = bisect.bisect_right(self.steps, step) - 1
+        return max(i, 0)
+
+    def frame(self, i):
+        """
+        Retorna el estado grabado en la posición i de la traza.
+
+        Args:
+            i (int): Posición del registro (0 <= i < len(self)).
+
+        Returns:
+            dict: Paso, coches (id, x, y), estado de cada semáforo y coches que llegaron.
+        """
+        step, car_start, car_count, arrival_start, arrival_count = \
+            self.columns["index"][i * INDEX_FIELDS:(i + 1) * INDEX_FIELDS]
+        car_end = car_start + car_count
+        light_bytes = self.meta["light_bytes"]
+        bits = int.from_bytes(self.columns["lights"][i * light_bytes:(i + 1) * light_bytes], "little")
+        return {
+            "step": step,
+            "cars": list(zip(
+                self.columns["car_id"][car_start:car_end],
+                self.columns["car_x"][car_start:car_end],
+                self.columns["car_y"][car_start:car_end],
+            )),
+            "lights": [bool(bits >> j & 1) for j in range(len(self.meta["traffic_lights"]))],
+            "arrivals": list(self.columns["arrival_id"][arrival_start:arrival_start + arrival_count]),
+        }
+
+    def close(self):
+        """Libera los mapas de memoria de la traza."""
+        for name in list(self.columns):
+            self.columns[name].release()
+        self.steps.release()
+        for m in self.maps.values():
+            m.close()
+
+
+class TracePlayer:
+    """
+    Reproductor de una traza con los mismos formatos de respuesta que el servidor.
+
+    Mantiene una posición (fraccional) dentro de la traza que avanza speed registros por cada
+    paso solicitado; speed puede ser menor que 1 (cámara lenta), mayor que 1 o negativo
+    (reproducción hacia atrás). La capa estática se construye una vez a partir de meta.json.
+    """
+
+    def __init__(self, path, speed=1.0, step=None):
+        """
+        Abre una traza para reproducirla.
+
+        Args:
+            path (str): Directorio de la traza.
+            speed (float): Registros que avanza la reproducción por cada paso.
+            step (int): Paso de la simulación donde empezar (None para el primero grabado).
+        """
+        self.reader = TraceReader(path)
+        if len(self.reader) == 0:
+            raise ValueError(f"La traza {path} no tiene pasos grabados.")
+        self.speed = speed
+        self.position = 0.0  # Posición en la traza (índice de registro, fraccional)
+        self.cached = (None, None)  # (índice, frame) del último registro leído
+        if step is not None:
+            self.seek(step)
+
+        meta = self.reader.meta
+        self.width = meta["width"]
+        self.height = meta["height"]
+        self.car_prefix = meta["car_prefix"]
+        self.roads = [{
+            "id": road_id, "x": x, "y": 1, "z": z, "direction": direction
+        } for road_id, x, z, direction in meta["roads"]]
+        self.obstacles = [{"id": agent_id, "x": x, "y": 1, "z": z} for agent_id, x, z in meta["obstacles"]]
+        self.destinations = [{"id": agent_id, "x": x, "y": 1, "z": z} for agent_id, x, z in meta["destinations"]]
+
+    def seek(self, step):
+        """Mueve la reproducción al último registro grabado que no es posterior a step."""
+        self.position = float(self.reader.find(step))
+
+    def advance(self, steps=1):
+        """
+        Avanza la reproducción steps pasos a la velocidad actual, sin salir de la traza.
+
+        Returns:
+            int: Paso de la simulación en la nueva posición.
+        """
+        self.position = min(max(self.position + steps * self.speed, 0.0), len(self.reader) - 1.0)
+        return self.step
+
+    def frame(self):
+        """Retorna el registro de la posición actual (se guarda el último leído)."""
+        index = int(self.position)
+        if self.cached[0] != index:
+            self.cached = (index, self.reader.frame(index))
+        return self.cached[1]
+
+    @property
+    def step(self):
+        """Paso de la simulación en la posición actual."""
+        return self.frame()["step"]
+
+    @property
+    def finished(self):
+        """True si la reproducción está en el extremo hacia el que avanza."""
+        if self.speed < 0:
+            return self.position <= 0
+        return self.position >= len(self.reader) - 1
+
+    def agent_positions(self):
+        """Retorna las posiciones de los coches en el formato de /getAgents."""
+        prefix = self.car_prefix
+        return [{
+            "id": f"{prefix}{car_id}", "x": x, "y": 1, "z": z
+        } for car_id, x, z in self.frame()["cars"]]
+
+    def traffic_lights(self):
+        """Retorna los semáforos y su estado en el formato de /getTrafficLights."""
+        return [{
+            "id": light_id, "x": x, "y": 1, "z": z, "state": state
+        } for (light_id, x, z), state in zip(self.reader.meta["traffic_lights"], self.frame()["lights"])]
+
+    def snapshot(self):
+        """Retorna el estado visible en el mismo formato que CityModel.snapshot."""
+        return {
+            "step": self.step,
+            "positions": self.agent_positions(),
+            "trafficLights": self.traffic_lights(),
+        }
+
+    def close(self):
+        """Cierra la traza."""
+        self.cached = (None, None)
+        self.reader.close()
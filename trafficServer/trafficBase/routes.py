@@ -0,0 +1,114 @@
+"""
+Reto - Movilidad Urbana
+Modelación de Sistemas Multiagentes con Gráficas Computacionales
+28/11/2024
+Francisco José Urquizo Schnaas A01028786
+Gabriel Edid Harari A01782146
+routes.py
+"""
+
+# Importaciones necesarias desde las bibliotecas estándar
+from array import array  # Almacenamiento compacto de las celdas de todas las rutas
+
+COMPACT_MIN_CELLS = 4096  # Tamaño mínimo del arreglo antes de considerar compactarlo
+
+
+class RouteStore:
+    """
+    Almacén compartido e inmutable de rutas.
+
+    Todas las rutas se guardan codificadas (y * width + x) en un solo arreglo contiguo. Las rutas
+    idénticas se comparten: cada coche guarda solo el identificador de la ruta y un cursor. El
+    índice para encontrar rutas idénticas guarda solo el hash del contenido; una coincidencia se
+    confirma comparando contra las celdas ya almacenadas, así que no se duplica cada ruta. Se
+    lleva un conteo de referencias para liberar rutas sin usuarios y compactar el arreglo cuando
+    la mitad de su contenido ya no se usa.
+    """
+
+    def __init__(self, width):
+        """
+        Inicializa el almacén vacío.
+
+        Args:
+            width (int): Ancho del grid, usado para codificar las celdas.
+        """
+        self.width = width
+        self.cells = array("i")  # Celdas codificadas de todas las rutas
+        self.spans = {}  # Identificador -> (inicio, longitud) dentro de cells
+        self.refs = {}  # Identificador -> número de coches que usan la ruta
+        self.index = {}  # Hash del contenido -> identificadores de rutas con ese hash
+        self.hashes = {}  # Identificador -> hash del contenido (para retirarlo del índice)
+        self.next_id = 0
+        self.dead = 0  # Celdas ocupadas por rutas ya liberadas
+
+    def intern(self, path):
+        """
+        Registra una ruta (o reutiliza una idéntica) y suma una referencia.
+
+        Args:
+            path (list): Celdas (x, y) de la ruta.
+
+        Returns:
+            int: Identificador de la ruta.
+        """
+        width = self.width
+        encoded = array("i", [y * width + x for x, y in path])
+        key = hash(encoded.tobytes())
+        route_id = self.find(key, encoded)
+        if route_id is None:
+            route_id = self.next_id
+            self.next_id += 1
+            self.spans[route_id] = (len(self.cells), len(encoded))
+            self.cells.extend(encoded)
+            self.refs[route_id] = 0
+            self.index.setdefault(key, []).append(route_id)
+            self.hashes[route_id] = key
+        self.refs[route_id] += 1
+        return route_id
+
+    def find(self, key, encoded):
+        """Retorna el identificador de una ruta almacenada idéntica a encoded, o None."""
+        cells = self.cells
+        for route_id in self.index.get(key, ()):
+            start, length = self.spans[route_id]
+            if length == len(encoded) and cells[start:start + length] == encoded:
+                return route_id
+        return None
+
+    def release(self, route_id):
+        """Quita una referencia a la ruta y la libera cuando ya nadie la usa."""
+        self.refs[route_id] -= 1
+        if self.refs[route_id] == 0:
+            del self.refs[route_id]
+            key = self.hashes.pop(route_id)
+            bucket = self.index[key]
+            bucket.remove(route_id)
+            if not bucket:
+                del self.index[key]
+            self.dead += self.spans.pop(route_id)[1]
+            if len(self.cells) > COMPACT_MIN_CELLS and self.dead * 2 > len(self.cells):
+                self.compact()
+
+    def compact(self):
+        """Reconstruye el arreglo solo con las rutas en uso; los identificadores no cambian."""
+        cells = array("i")
+        for route_id, (start, length) in self.spans.items():
+            self.spans[route_id] = (len(cells), length)
+            cells.extend(self.cells[start:start + length])
+        self.cells = cells
+        self.dead = 0
+
+    def length(self, route_id):
+        """Retorna el número de celdas de una ruta."""
+        return self.spans[route_id][1]
+
+    def cell(self, route_id, i):
+        """Retorna la celda (x, y) en la posición i de una ruta."""
+        y, x = divmod(self.cells[self.spans[route_id][0] + i], self.width)
+        return (x, y)
+
+    def cells_from(self, route_id, i):
+        """Retorna las celdas (x, y) de una ruta a partir de la posición i."""
+        start, length = self.spans[route_id]
+        width = self.width
+        return [(code % width, code // width) for code in self.cells[start + i:start + length]]
@@ -0,0 +1,208 @@
+"""
+Reto - Movilidad Urbana
+Modelación de Sistemas Multiagentes con Gráficas Computacionales
+28/11/2024
+Francisco José Urquizo Schnaas A01028786
+Gabriel Edid Harari A01782146
+scheduler.py
+"""
+
+# Importaciones necesarias desde las bibliotecas estándar y la biblioteca Mesa
+import heapq  # Colas de prioridad de agentes activos y de solicitudes de ruta
+from mesa.time import BaseScheduler  # Scheduler básico del que se hereda el orden de activación
+
+
+class EventScheduler(BaseScheduler):
+    """
+    Scheduler que solo activa a los agentes que pueden avanzar.
+
+    Conserva el orden de activación de BaseScheduler, pero permite "estacionar" agentes que
+    esperan un evento: quedan en listas de espera por celda (un semáforo que cambia a verde o un
+    coche que libera la celda) y opcionalmente en una rueda de tiempos para despertar después de
+    cierto número de pasos. El costo de cada paso depende de los agentes activos, no del total.
+    """
+
+    def __init__(self, model, agents=None):
+        """
+        Inicializa el scheduler.
+
+        Args:
+            model (Model): Modelo al que pertenece el scheduler.
+            agents (iterable): Agentes iniciales.
+        """
+        self.order = {}  # Agente -> número de secuencia (orden de activación)
+        self.active = {}  # Número de secuencia -> agente activo
+        self.parked = {}  # Agente estacionado -> generación de su espera actual
+        self.waiting = {}  # Celda -> lista de (agente, generación) que esperan en ella
+        self.wheel = {}  # Paso -> lista de (agente, generación) que despiertan en ese paso
+        self.next_seq = 0
+        self.generation = 0
+        self.cursor = None  # Secuencia del agente en ejecución durante un paso
+        self.pending = []  # Secuencias por activar en el paso en curso
+        super().__init__(model, agents)
+        for agent in self._agents:
+            self.track(agent)
+
+    def track(self, agent):
+        """Asigna número de secuencia a un agente y lo marca como activo."""
+        self.order[agent] = self.next_seq
+        self.active[self.next_seq] = agent
+        self.next_seq += 1
+
+    def add(self, agent):
+        """Añade un agente al scheduler como activo."""
+        super().add(agent)
+        self.track(agent)
+
+    def remove(self, agent):
+        """Retira un agente del scheduler, esté activo o estacionado."""
+        super().remove(agent)
+        seq = self.order.pop(agent)
+        self.active.pop(seq, None)
+        self.parked.pop(agent, None)
+
+    def park(self, agent, cell=None, timeout=None):
+        """
+        Deja de activar a un agente hasta que ocurra un evento.
+
+        Args:
+            agent (Agent): Agente a estacionar.
+            cell (tuple): Celda cuyo evento (notify) despierta al agente.
+            timeout (int): Número de pasos tras los cuales el agente despierta de todas formas.
+        """
+        seq = self.order.get(agent)
+        if seq is None:
+            return
+        self.active.pop(seq, None)
+        self.generation += 1
+        self.parked[agent] = self.generation
+        if cell is not None:
+            self.waiting.setdefault(cell, []).append((agent, self.generation))
+        if timeout is not None:
+            self.wheel.setdefault(self.steps + timeout, []).append((agent, self.generation))
+
+    def wake(self, agent, generation=None):
+        """
+        Reactiva a un agente estacionado.
+
+        Si se indica generation, solo se despierta cuando corresponde a su espera vigente.
+        Si el agente va después del que se está ejecutando, se activa en este mismo paso.
+        """
+        current = self.parked.get(agent)
+        if current is None or (generation is not None and generation != current):
+            return
+        del self.parked[agent]
+        seq = self.order[agent]
+        self.active[seq] = agent
+        if self.cursor is not None and seq > self.cursor:
+            heapq.heappush(self.pending, seq)
+
+    def notify(self, cell):
+        """Despierta a los agentes que esperan un evento en la celda indicada."""
+        for agent, generation in self.waiting.pop(cell, ()):
+            self.wake(agent, generation)
+
+    def get_parked_count(self):
+        """Retorna el número de agentes estacionados."""
+        return len(self.parked)
+
+    def step(self):
+        """Activa una vez a cada agente activo, en orden de inserción."""
+        for agent, generation in self.wheel.pop(self.steps, ()):
+            self.wake(agent, generation)
+
+        self.pending = list(self.active)
+        heapq.heapify(self.pending)
+        self.cursor = -1
+        while self.pending:
+            seq = heapq.heappop(self.pending)
+            if seq <= self.cursor:
+                continue
+            agent = self.active.get(seq)
+            if agent is None:
+                continue  # Retirado o estacionado durante este paso
+            self.cursor = seq
+            agent.step()
+        self.cursor = None
+        self.steps += 1
+        self.time += 1
+
+
+PRIORITY_NEW = 0  # Coches sin ruta: recién creados o que acaban de cambiar de carril
+PRIORITY_STUCK = 1  # Coches atascados que piden una ruta alternativa
+PRIORITY_REFRESH = 2  # Coches que agotaron una ruta parcial y piden el siguiente tramo
+
+
+class PlanningQueue:
+    """
+    Cola de solicitudes de ruta atendida por prioridad.
+
+    Cada coche aparece a lo más una vez: si vuelve a pedir ruta con mejor prioridad se promueve
+    conservando el paso de su primera solicitud, así que dentro de una misma prioridad se atiende
+    primero a quien lleva más tiempo esperando. Las solicitudes también se indexan por destino
+    para resolver juntas las de un mismo destino.
+    """
+
+    def __init__(self):
+        """Inicializa la cola vacía."""
+        self.heap = []  # (prioridad, paso de la solicitud, secuencia, coche), con borrado perezoso
+        self.entries = {}  # Coche -> (prioridad, paso de la solicitud, secuencia) vigente
+        self.goals = {}  # Destino -> coches en espera hacia ese destino (en orden de llegada)
+        self.next_seq = 0
+
+    def __len__(self):
+        """Retorna el número de solicitudes pendientes."""
+        return len(self.entries)
+
+    def __contains__(self, car):
+        """Indica si un coche espera ruta."""
+        return car in self.entries
+
+    def push(self, car, priority, step):
+        """
+        Encola la solicitud de ruta de un coche.
+
+        Args:
+            car (Car): Coche que pide ruta.
+            priority (int): PRIORITY_NEW, PRIORITY_STUCK o PRIORITY_REFRESH (menor se atiende antes).
+            step (int): Paso en que se hace la solicitud.
+        """
+        current = self.entries.get(car)
+        if current is not None:
+            if current[0] <= priority:
+                return  # Ya espera con igual o mejor prioridad
+            step = current[1]
+        entry = (priority, step, self.next_seq)
+        self.next_seq += 1
+        self.entries[car] = entry
+        heapq.heappush(self.heap, entry + (car,))
+        self.goals.setdefault(car.destination_pos, {})[car] = None
+
+    def discard(self, car):
+        """Retira la solicitud de un coche, si la hay."""
+        if self.entries.pop(car, None) is not None:
+            waiting = self.goals[car.destination_pos]
+            del waiting[car]
+            if not waiting:
+                del self.goals[car.destination_pos]
+
+    def pop(self):
+        """Retira y retorna el coche con la solicitud más prioritaria, o None si la cola está vacía."""
+        while self.heap:
+            entry = heapq.heappop(self.heap)
+            car = entry[3]
+            if self.entries.get(car) == entry[:3]:
+                self.discard(car)
+                return car
+        return None
+
+    def take_goal(self, goal):
+        """Retira y retorna los coches que esperan ruta hacia un destino."""
+        cars = list(self.goals.pop(goal, ()))
+        for car in cars:
+            del self.entries[car]
+        return cars
+
+    def get_pending_count(self):
+        """Retorna el número de coches que esperan ruta."""
+        return len(self.entries)
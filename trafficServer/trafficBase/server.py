@@ -8,19 +8,35 @@ server.py
 """
 
 # Importaciones necesarias desde los módulos locales y la biblioteca Mesa
-from agent import *  # Importa todas las clases de agentes definidas en el módulo agent
-from model import CityModel  # Importa la clase principal del modelo de la ciudad
-from mesa.visualization import CanvasGrid, TextElement  # Importa herramientas de visualización de Mesa
+import os  # Para ubicar los archivos JavaScript locales del módulo de visualización
+from .agent import Traffic_Light  # Único agente que se distingue por estado al representarlo
+from .model import CityModel  # Importa la clase principal del modelo de la ciudad
+from mesa.visualization import TextElement, VisualizationElement  # Importa herramientas de visualización de Mesa
 from mesa.visualization import ModularServer  # Importa el servidor modular para la visualización
 from mesa.visualization import Slider  # Importa el componente Slider para controles interactivos
 
+# Representación de cada tipo de agente, precalculada una sola vez
+PORTRAYALS = {
+    "Car": {"Shape": "rect", "Filled": "true", "Layer": 1, "w": 0.5, "h": 0.5, "Color": "purple"},
+    "Road": {"Shape": "rect", "Filled": "true", "Layer": 0, "w": 1, "h": 1, "Color": "grey"},
+    "Destination": {"Shape": "rect", "Filled": "true", "Layer": 0, "w": 1, "h": 1, "Color": "lightgreen"},
+    "Traffic_Light_green": {"Shape": "rect", "Filled": "true", "Layer": 0, "w": 0.8, "h": 0.8, "Color": "green"},
+    "Traffic_Light_red": {"Shape": "rect", "Filled": "true", "Layer": 0, "w": 0.8, "h": 0.8, "Color": "red"},
+    "Obstacle": {"Shape": "rect", "Filled": "true", "Layer": 0, "w": 0.8, "h": 0.8, "Color": "cadetblue"},
+}
+
+def portrayal_key(agent):
+    """Retorna la llave de PORTRAYALS que corresponde a un agente."""
+    if isinstance(agent, Traffic_Light):
+        return "Traffic_Light_green" if agent.state else "Traffic_Light_red"
+    return type(agent).__name__
+
 def agent_portrayal(agent):
     """
     Define cómo se representa cada agente en la visualización de la cuadrícula.
 
-    Esta función determina las propiedades visuales de cada agente, como su forma, color, 
-    tamaño y capa en la que se dibuja, dependiendo del tipo de agente (Car, Road, Destination, 
-    Traffic_Light, Obstacle).
+    La representación de cada tipo (Car, Road, Destination, Traffic_Light, Obstacle) está
+    precalculada en PORTRAYALS; aquí solo se copia la que corresponde al agente.
 
     Parámetros:
         agent: Instancia del agente a representar.
@@ -30,52 +46,69 @@ def agent_portrayal(agent):
     """
     if agent is None:
         return  # No hay agente para representar en esta celda
-    
-    # Definición base de la representación del agente
-    portrayal = {
-        "Shape": "rect",  # Forma rectangular
-        "Filled": "true",  # Forma rellena
-        "Layer": 1,        # Capa de dibujo por defecto
-        "w": 0.5 if isinstance(agent, Car) else 1,  # Ancho ajustado para los coches
-        "h": 0.5 if isinstance(agent, Car) else 1   # Alto ajustado para los coches
-    }
-
-    # Configuración específica para cada tipo de agente
-    if isinstance(agent, Car):
-        portrayal["Color"] = "purple"  # Color púrpura para los coches
-        portrayal["Layer"] = 1  # Capa superior para que se dibujen sobre otros elementos
+    portrayal = PORTRAYALS.get(portrayal_key(agent))
+    return dict(portrayal) if portrayal else None
 
-    elif isinstance(agent, Road):
-        portrayal["Color"] = "grey"  # Color gris para las carreteras
-        portrayal["Layer"] = 0  # Capa inferior
-
-    elif isinstance(agent, Destination):
-        portrayal["Color"] = "lightgreen"  # Color verde claro para destinos
-        portrayal["Layer"] = 0  # Capa inferior
-
-    elif isinstance(agent, Traffic_Light):
-        portrayal["Color"] = "red" if not agent.state else "green"  # Rojo si está en estado 'no', verde si está en 'sí'
-        portrayal["Layer"] = 0  # Capa inferior
-        portrayal["w"] = 0.8  # Ancho ajustado
-        portrayal["h"] = 0.8  # Alto ajustado
+class StaticLayerCanvas(VisualizationElement):
+    """
+    Cuadrícula de la ciudad que envía la capa estática una sola vez.
 
-    elif isinstance(agent, Obstacle):
-        portrayal["Color"] = "cadetblue"  # Color azul cadete para obstáculos
-        portrayal["Layer"] = 0  # Capa inferior
-        portrayal["w"] = 0.8  # Ancho ajustado
-        portrayal["h"] = 0.8  # Alto ajustado
+    Calles, obstáculos y destinos no cambian durante la simulación, así que se envían solo en el
+    primer frame de cada modelo (después de un reset) y el navegador los guarda en su propio
+    canvas. En los demás frames solo se envían las posiciones de coches y semáforos.
+    """
+    local_includes = ["StaticLayerModule.js"]
+    local_dir = os.path.dirname(os.path.abspath(__file__))
+
+    def __init__(self, grid_width, grid_height, canvas_width=500, canvas_height=500):
+        """
+        Parámetros:
+            grid_width, grid_height: Tamaño del grid en celdas.
+            canvas_width, canvas_height: Tamaño del canvas en píxeles.
+        """
+        super().__init__()
+        self.model = None  # Modelo cuya capa estática ya se envió
+        self.js_code = "elements.push(new StaticLayerModule({}, {}, {}, {}));".format(
+            canvas_width, canvas_height, grid_width, grid_height
+        )
 
-    return portrayal  # Retorna el diccionario de propiedades para la representación
+    def render(self, model):
+        data = {
+            "dynamic": {
+                "Car": [car.pos for car in model.cars if car.pos is not None],
+                "Traffic_Light_green": [light.pos for light in model.traffic_lights if light.state],
+                "Traffic_Light_red": [light.pos for light in model.traffic_lights if not light.state],
+            }
+        }
+        if model is not self.model:
+            # Primer frame de este modelo: incluir la capa estática y los estilos
+            self.model = model
+            data["static"] = {
+                "Road": [road.pos for road in model.roads],
+                "Obstacle": [obstacle.pos for obstacle in model.obstacles],
+                "Destination": [destination.pos for destination in model.destinations],
+            }
+            data["styles"] = PORTRAYALS
+        return data
+
+# Mapa que carga CityModel, usado para dimensionar la visualización
+MAP_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'city_files', 'concurso.txt')
+
+def map_dimensions(path=MAP_FILE):
+    """
+    Lee un archivo de mapa para determinar el ancho y alto del grid.
 
-# Inicialización de las dimensiones del mapa
-width = 0
-height = 0
+    Parámetros:
+        path: Ruta del archivo del mapa.
 
-# Cargar el mapa desde un archivo para determinar el ancho y alto del grid
-with open('../city_files/concurso.txt') as baseFile:
-    lines = baseFile.readlines()  # Lee todas las líneas del archivo
+    Retorna:
+        Una tupla (ancho, alto) en celdas.
+    """
+    with open(path) as baseFile:
+        lines = baseFile.readlines()  # Lee todas las líneas del archivo
     width = len(lines[0].strip())  # Determina el ancho basado en la primera línea, eliminando posibles saltos de línea
     height = len(lines)  # Determina el alto basado en el número total de líneas
+    return width, height
 
 class ReachedDestinationsElement(TextElement):
     """
@@ -97,28 +130,39 @@ class CarsInSimElement(TextElement):
         cars_in_sim = model.compute_cars_in_sim()  # Calcula la cantidad de coches en la simulación
         return f"Cars In Sim: {cars_in_sim}"  # Retorna el texto a mostrar
 
-# Instanciación de los elementos de texto para la visualización
-cars_in_sim = CarsInSimElement()
-reached_destinations = ReachedDestinationsElement()
-
-# Definición de los parámetros del modelo, incluyendo el ancho y alto del grid
-model_params = {
-    "width": width,   # Ancho del grid basado en el mapa cargado
-    "height": height  # Alto del grid basado en el mapa cargado
-}
+def create_server():
+    """
+    Construye el servidor modular de Mesa; el mapa se lee aquí y no al importar el módulo.
 
-print(width, height)  # Imprime las dimensiones del grid en la consola para verificación
+    Retorna:
+        El ModularServer configurado con la cuadrícula y los elementos de texto.
+    """
+    width, height = map_dimensions()
+    print(width, height)  # Imprime las dimensiones del grid en la consola para verificación
 
-# Configuración de la cuadrícula de la visualización usando CanvasGrid
-grid = CanvasGrid(agent_portrayal, width, height, 500, 500)  # Tamaño de visualización de 500x500 píxeles
+    # Instanciación de los elementos de texto para la visualización
+    cars_in_sim = CarsInSimElement()
+    reached_destinations = ReachedDestinationsElement()
 
-# Configuración del servidor modular para la visualización de Mesa
-server = ModularServer(
-    CityModel,  # Clase del modelo a ejecutar
-    [grid, cars_in_sim, reached_destinations],  # Componentes de visualización a incluir
-    "Traffic Base",  # Título de la visualización
-    model_params  # Parámetros del modelo
-)
+    # Definición de los parámetros del modelo, incluyendo el ancho y alto del grid
+    model_params = {
+        "width": width,   # Ancho del grid basado en el mapa cargado
+        "height": height  # Alto del grid basado en el mapa cargado
+    }
 
-server.port = 8521  # Asigna el puerto por defecto para acceder al servidor
-server.launch()  # Inicia el servidor y lanza la interfaz de visualización
+    # Configuración de la cuadrícula de la visualización con la capa estática en caché
+    grid = StaticLayerCanvas(width, height, 500, 500)  # Tamaño de visualización de 500x500 píxeles
+
+    # Configuración del servidor modular para la visualización de Mesa
+    server = ModularServer(
+        CityModel,  # Clase del modelo a ejecutar
+        [grid, cars_in_sim, reached_destinations],  # Componentes de visualización a incluir
+        "Traffic Base",  # Título de la visualización
+        model_params  # Parámetros del modelo
+    )
+    server.port = 8521  # Asigna el puerto por defecto para acceder al servidor
+    return server
+
+if __name__ == '__main__':
+    # Ejecutar desde trafficServer como paquete: python -m trafficBase.server
+    create_server().launch()  # Inicia el servidor y lanza la interfaz de visualización
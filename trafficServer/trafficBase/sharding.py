@@ -0,0 +1,540 @@
+"""
+Reto - Movilidad Urbana
+Modelación de Sistemas Multiagentes con Gráficas Computacionales
+28/11/2024
+Francisco José Urquizo Schnaas A01028786
+Gabriel Edid Harari A01782146
+sharding.py
+"""
+
+# Importaciones necesarias desde las bibliotecas estándar
+import os  # Para usar un worker por núcleo por defecto
+import time  # Para medir el tiempo ocupado de cada worker
+import uuid  # Para generar identificadores de sesión
+import pickle  # Para migrar sesiones completas entre workers
+import threading  # Para serializar las peticiones a cada worker
+from array import array  # Frames como enteros de 32 bits
+from functools import partial  # Para fijar la configuración de los modelos del worker
+import multiprocessing  # Procesos worker y canales de comandos
+from multiprocessing import shared_memory  # Frames compartidos entre procesos
+import numpy as np  # Arreglos de los mapas de calor
+from .recorder import car_number  # Número de cada coche a partir de su unique_id
+from .analytics import heatmap_response  # Respuesta de /heatmap armada en el proceso frontal
+from .spatial import RowIndex  # Consultas por caja o tile sobre las filas de cada sesión
+
+FRAME_HEADER = 3  # step, número de coches, número de semáforos
+MIN_FRAME_BYTES = 1 << 20  # Tamaño inicial de la memoria compartida de cada worker
+HEATMAP_ARRAYS = ("occupancy", "wait", "queue_ticks", "queue_now", "trip_count", "trip_total", "trip_max")
+
+
+def encode_frame(model):
+    """
+    Codifica el estado visible del modelo como columnas de enteros.
+
+    El formato es [step, n_coches, n_semáforos, ids, xs, zs, estados]; los ids de coche son el
+    número de su unique_id (car_<n>) y los semáforos van en el orden de model.traffic_lights.
+
+    Returns:
+        array: Frame codificado.
+    """
+    cars = [car for car in model.cars if car.pos is not None]
+    lights = [light for light in model.traffic_lights if light.pos is not None]
+    frame = array("i", (model.step_count, len(cars), len(lights)))
+    frame.extend(car_number(car) for car in cars)
+    frame.extend(car.pos[0] for car in cars)
+    frame.extend(car.pos[1] for car in cars)
+    frame.extend(1 if light.state else 0 for light in lights)
+    return frame
+
+
+def static_layer(model):
+    """Retorna la capa estática del modelo en el formato de respuesta del servidor."""
+    return {
+        "width": model.width,
+        "height": model.height,
+        "roads": [{
+            "id": str(road.unique_id), "x": road.pos[0], "y": 1, "z": road.pos[1], "direction": road.direction
+        } for road in model.roads if road.pos is not None],
+        "obstacles": [{
+            "id": str(obstacle.unique_id), "x": obstacle.pos[0], "y": 1, "z": obstacle.pos[1]
+        } for obstacle in model.obstacles if obstacle.pos is not None],
+        "destinations": [{
+            "id": str(destination.unique_id), "x": destination.pos[0], "y": 1, "z": destination.pos[1]
+        } for destination in model.destinations if destination.pos is not None],
+        "lights": [
+            (str(light.unique_id), light.pos[0], light.pos[1])
+            for light in model.traffic_lights if light.pos is not None
+        ],
+    }
+
+
+class Frame:
+    """Frame decodificado en el proceso frontal; arma las respuestas de los endpoints."""
+
+    def __init__(self, data, lights):
+        """
+        Args:
+            data (array): Frame codificado por encode_frame.
+            lights (list): (id, x, z) de cada semáforo de la sesión.
+        """
+        self.step, cars, light_count = data[0], data[1], data[2]
+        start = FRAME_HEADER
+        self.ids = data[start:start + cars]
+        self.xs = data[start + cars:start + 2 * cars]
+        self.zs = data[start + 2 * cars:start + 3 * cars]
+        self.states = data[start + 3 * cars:start + 3 * cars + light_count]
+        self.lights = lights
+        self.index = None  # Índice de las posiciones, se construye en la primera consulta por caja
+
+    def positions(self):
+        """Posiciones de los coches en el formato de /getAgents."""
+        return [{"id": f"car_{car_id}", "x": x, "y": 1, "z": z} for car_id, x, z in zip(self.ids, self.xs, self.zs)]
+
+    def positions_index(self, width, height):
+        """Retorna el índice por cubetas de las posiciones de este frame, construyéndolo al primer uso."""
+        if self.index is None:
+            self.index = RowIndex(self.positions(), width, height)
+        return self.index
+
+    def traffic_lights(self):
+        """Semáforos y su estado en el formato de /getTrafficLights."""
+        return [{
+            "id": light_id, "x": x, "y": 1, "z": z, "state": bool(state)
+        } for (light_id, x, z), state in zip(self.lights, self.states)]
+
+    def snapshot(self):
+        """Estado visible en el mismo formato que CityModel.snapshot."""
+        return {"step": self.step, "positions": self.positions(), "trafficLights": self.traffic_lights()}
+
+
+def write_blocks(buf, blocks):
+    """
+    Escribe bloques de datos uno tras otro en la memoria compartida.
+
+    Args:
+        buf (memoryview): Memoria compartida del worker, con espacio suficiente.
+        blocks (list): (nombre, tipo de array, bytes) de cada bloque.
+
+    Returns:
+        list: (nombre, tipo de array, inicio, bytes) de cada bloque, para leerlos en el proceso frontal.
+    """
+    layout = []
+    offset = 0
+    for name, typecode, data in blocks:
+        buf[offset:offset + len(data)] = data
+        layout.append((name, typecode, offset, len(data)))
+        offset += len(data)
+    return layout
+
+
+def read_blocks(buf, layout):
+    """Copia de la memoria compartida los bloques descritos por write_blocks, como (nombre, array)."""
+    blocks = []
+    for name, typecode, offset, size in layout:
+        data = array(typecode)
+        data.frombytes(buf[offset:offset + size])
+        blocks.append((name, data))
+    return blocks
+
+
+def worker_main(conn, shm_name, pool_size, verbose):
+    """
+    Ciclo principal de un proceso worker.
+
+    Recibe comandos (comando, sesión, argumentos) por conn, mantiene los modelos de sus sesiones
+    y escribe los datos resultantes de cada comando (el frame actual, los frames del avance
+    rápido y los arreglos del mapa de calor) en la memoria compartida. Por conn solo regresan el
+    estado, un resultado pequeño, la ubicación de cada bloque y el tiempo ocupado. Si los datos
+    no caben, se conservan hasta que el proceso frontal agrande la memoria y pida "flush".
+    """
+    from .model import CityModel  # Se importa en el worker, no en el proceso frontal
+    from .pool import ModelPool
+
+    pool = ModelPool(partial(CityModel, verbose=verbose), size=pool_size)
+    pool.warm()
+    sessions = {}  # Sesión -> modelo
+    pending = None  # (resultado, bloques) que no cupieron en la memoria compartida
+    # Los workers comparten el resource tracker del proceso frontal, que es quien libera la memoria
+    shm = shared_memory.SharedMemory(name=shm_name)
+
+    while True:
+        try:
+            command, session, args = conn.recv()
+        except (EOFError, OSError):
+            break  # El proceso frontal terminó
+        start = time.perf_counter()
+        result, model, blocks = None, sessions.get(session), []
+        try:
+            if command == "stop":
+                conn.send(("ok", None, [], 0.0))
+                break
+            elif command == "attach":
+                shm.close()
+                shm = shared_memory.SharedMemory(name=args)
+            elif command == "flush":
+                (result, blocks), pending = pending, None
+            elif command == "init":
+                model = sessions[session] = pool.acquire(**args)
+                result = static_layer(model)
+            elif command == "import":
+                model = sessions[session] = pickle.loads(args)
+            elif model is None:
+                raise KeyError(f"Sesión {session} no encontrada.")
+            elif command == "update":
+                if args.get("fastForward"):
+                    frames = model.run_steps(args["steps"], collect_every=args.get("collectEvery"),
+                                             frame_every=args.get("frameEvery"), encode=encode_frame)
+                    blocks.extend(("frames", "i", frame.tobytes()) for frame in frames)
+                else:
+                    for _ in range(args["steps"]):
+                        model.step()
+            elif command == "heatmap":
+                stats = model.heatmap()
+                if stats is not None:
+                    result = stats["ticks"]
+                    blocks.extend((name, "q", np.ascontiguousarray(stats[name], dtype=np.int64).tobytes())
+                                  for name in HEATMAP_ARRAYS)
+            elif command == "export":
+                result = pickle.dumps(model)  # La sesión sigue aquí hasta que el destino la importe
+                model = None
+            elif command in ("release", "close"):
+                del sessions[session]
+                model = None
+
+            if command in ("init", "import", "update", "frame"):
+                blocks.insert(0, ("frame", "i", encode_frame(model).tobytes()))
+            size = sum(len(data) for _, _, data in blocks)
+            if size > shm.size:
+                pending = (result, blocks)
+                conn.send(("resize", None, size, time.perf_counter() - start))
+                continue
+            conn.send(("ok", result, write_blocks(shm.buf, blocks), time.perf_counter() - start))
+        except Exception as e:
+            conn.send(("error", str(e), [], time.perf_counter() - start))
+    shm.close()
+
+
+class WorkerHandle:
+    """Proceso worker visto desde el proceso frontal: canal de comandos y memoria compartida."""
+
+    def __init__(self, index, context, pool_size=1, verbose=False):
+        """
+        Inicia el proceso worker.
+
+        Args:
+            index (int): Número del worker.
+            context: Contexto de multiprocessing con el que se crea el proceso.
+            pool_size (int): Modelos precalentados que mantiene el worker.
+            verbose (bool): Imprimir los eventos de los agentes en el worker.
+        """
+        self.index = index
+        self.lock = threading.Lock()  # Un comando a la vez por worker
+        self.sessions = set()
+        self.shm = shared_memory.SharedMemory(create=True, size=MIN_FRAME_BYTES)
+        self.conn, child = context.Pipe()
+        self.process = context.Process(
+            target=worker_main, args=(child, self.shm.name, pool_size, verbose),
+            name=f"traffic-worker-{index}", daemon=True
+        )
+        self.process.start()
+        child.close()
+
+    def send(self, command, session=None, args=None):
+        """Envía un comando y espera su respuesta (sin tomar el candado)."""
+        self.conn.send((command, session, args))
+        return self.conn.recv()
+
+    def request(self, command, session=None, args=None):
+        """
+        Ejecuta un comando en el worker y copia los bloques resultantes de la memoria compartida.
+
+        Returns:
+            tuple: (resultado, lista de (nombre, array) con los bloques, segundos ocupados del worker).
+
+        Raises:
+            RuntimeError: Si el worker reporta un error.
+        """
+        with self.lock:
+            status, result, layout, busy = self.send(command, session, args)
+            if status == "resize":
+                # Los datos no caben: crear una memoria más grande y pedir que los escriba
+                self.grow(layout)
+                status, result, layout, extra = self.send("flush", session)
+                busy += extra
+            if status == "error":
+                raise RuntimeError(result)
+            blocks = read_blocks(self.shm.buf, layout)
+        return result, blocks, busy
+
+    def grow(self, size):
+        """Reemplaza la memoria compartida por una del doble del tamaño requerido."""
+        old = self.shm
+        self.shm = shared_memory.SharedMemory(create=True, size=2 * size)
+        status, result, _, _ = self.send("attach", None, self.shm.name)
+        if status == "error":
+            raise RuntimeError(result)
+        old.close()
+        old.unlink()
+
+    def stop(self):
+        """Detiene el proceso worker y libera su memoria compartida."""
+        with self.lock:
+            if self.process.is_alive():
+                try:
+                    self.send("stop")
+                except (OSError, EOFError):
+                    pass
+                self.process.join(timeout=5)
+            self.shm.close()
+            self.shm.unlink()
+
+
+class Session:
+    """Sesión de un cliente: worker que la atiende, capa estática y último frame."""
+
+    def __init__(self, session_id, worker):
+        self.id = session_id
+        self.worker = worker
+        self.lock = threading.Lock()  # Un comando a la vez por sesión (y durante su migración)
+        self.static = None  # Capa estática del modelo de la sesión
+        self.indexes = {}  # Tipo de la capa estática -> RowIndex, se arma al iniciar el modelo
+        self.frame = None  # Último frame recibido del worker
+        self.busy = 0.0  # Segundos de worker consumidos desde el último rebalanceo
+        self.last_seen = time.time()
+
+
+class ShardRouter:
+    """
+    Reparte sesiones entre procesos worker y las rebalancea.
+
+    Cada sesión vive en un worker, que es dueño de su CityModel. Los comandos de una sesión se
+    envían a su worker y el frame resultante regresa por memoria compartida; el proceso frontal
+    guarda el último frame de cada sesión, así que /getAgents y /getTrafficLights no llegan al
+    worker. Cada interval segundos se mide la carga de cada worker (fracción del tiempo ocupado)
+    y, si el más cargado pasa de overload, se migra a otro worker una de sus sesiones.
+    """
+
+    def __init__(self, workers=None, pool_size=1, verbose=False, overload=0.75, interval=2.0,
+                 session_ttl=1800.0):
+        """
+        Inicia los workers y el hilo de rebalanceo.
+
+        Args:
+            workers (int): Número de procesos worker (None para uno por núcleo).
+            pool_size (int): Modelos precalentados por worker.
+            verbose (bool): Imprimir los eventos de los agentes en los workers.
+            overload (float): Carga (0 a 1) a partir de la cual se migran sesiones.
+            interval (float): Segundos entre rebalanceos.
+            session_ttl (float): Segundos sin peticiones tras los cuales se cierra una sesión.
+        """
+        context = multiprocessing.get_context("spawn")
+        self.workers = [
+            WorkerHandle(i, context, pool_size, verbose) for i in range(workers or os.cpu_count() or 1)
+        ]
+        self.sessions = {}  # Identificador -> Session
+        self.lock = threading.Lock()  # Protege sessions y la asignación de workers
+        self.loads = {worker: 0.0 for worker in self.workers}  # Carga medida en el último intervalo
+        self.overload = overload
+        self.interval = interval
+        self.session_ttl = session_ttl
+        self.migrations = 0
+        self.last_rebalance = time.perf_counter()
+        self.stopped = threading.Event()
+        self.balancer = threading.Thread(target=self.balance_loop, name="shard-balancer", daemon=True)
+        self.balancer.start()
+
+    @staticmethod
+    def new_session_id():
+        """Retorna un identificador de sesión nuevo."""
+        return uuid.uuid4().hex
+
+    def least_loaded(self, exclude=None):
+        """Retorna el worker con menor carga (y menos sesiones en caso de empate)."""
+        candidates = [worker for worker in self.workers if worker is not exclude]
+        return min(candidates, key=lambda worker: (self.loads[worker], len(worker.sessions)))
+
+    def get(self, session_id):
+        """Retorna una sesión existente, o None."""
+        with self.lock:
+            return self.sessions.get(session_id)
+
+    def init(self, session_id, config):
+        """
+        Inicia (o reinicia) el modelo de una sesión.
+
+        Args:
+            session_id (str): Identificador de la sesión.
+            config (dict): Argumentos de CityModel.
+
+        Returns:
+            Session: Sesión con su capa estática y su primer frame.
+        """
+        with self.lock:
+            session = self.sessions.get(session_id)
+            if session is None:
+                session = Session(session_id, self.least_loaded())
+                session.worker.sessions.add(session_id)
+                self.sessions[session_id] = session
+        with session.lock:
+            static, blocks, busy = session.worker.request("init", session_id, config)
+            session.static = static
+            session.indexes = {
+                kind: RowIndex(static[kind], static["width"], static["height"])
+                for kind in ("roads", "obstacles", "destinations")
+            }
+            session.frame = Frame(blocks[0][1], static["lights"])
+            session.busy += busy
+            session.last_seen = time.time()
+        return session
+
+    def call(self, session, command, args=None):
+        """
+        Ejecuta un comando en el worker de una sesión y guarda el frame que regrese.
+
+        Returns:
+            tuple: (resultado del comando, bloques restantes como lista de (nombre, array)).
+        """
+        with session.lock:
+            result, blocks, busy = session.worker.request(command, session.id, args)
+            if blocks and blocks[0][0] == "frame":
+                session.frame = Frame(blocks.pop(0)[1], session.static["lights"])
+            session.busy += busy
+            session.last_seen = time.time()
+        return result, blocks
+
+    def update(self, session, options):
+        """
+        Avanza el modelo de una sesión.
+
+        Args:
+            options (dict): Opciones validadas de /update (steps, fastForward, collectEvery, frameEvery).
+
+        Returns:
+            list: Snapshots de los frames tomados cada frameEvery pasos en modo rápido.
+        """
+        _, blocks = self.call(session, "update", options)
+        lights = session.static["lights"]
+        return [Frame(data, lights).snapshot() for name, data in blocks if name == "frames"]
+
+    def heatmap(self, session, encoding="list"):
+        """
+        Retorna la respuesta de /heatmap de una sesión, o None si sus métricas están desactivadas.
+
+        Los arreglos llegan por la memoria compartida; la respuesta se arma en el proceso frontal
+        con la capa estática de la sesión.
+        """
+        ticks, blocks = self.call(session, "heatmap")
+        if ticks is None:
+            return None
+        static = session.static
+        stats = {name: np.frombuffer(data, dtype=np.int64) for name, data in blocks}
+        stats["ticks"] = ticks
+        for name in ("occupancy", "wait"):
+            stats[name] = stats[name].reshape(static["height"], static["width"])
+        destinations = [(row["id"], row["x"], row["z"]) for row in static["destinations"]]
+        return heatmap_response(stats, session.frame.step, static["width"], static["height"],
+                                static["lights"], destinations, encoding)
+
+    def close(self, session_id):
+        """Cierra una sesión y libera su modelo en el worker."""
+        with self.lock:
+            session = self.sessions.pop(session_id, None)
+            if session is None:
+                return False
+            session.worker.sessions.discard(session_id)
+        with session.lock:
+            session.worker.request("close", session_id)
+        return True
+
+    def migrate(self, session, target):
+        """
+        Mueve una sesión (su modelo serializado) al worker target.
+
+        El worker de origen conserva el modelo hasta que el destino confirma la importación; si
+        la importación falla, la sesión sigue en el origen y se descarta lo que haya quedado en
+        el destino.
+        """
+        with session.lock:
+            source = session.worker
+            if source is target or session.id not in source.sessions:
+                return
+            data, _, _ = source.request("export", session.id)
+            try:
+                target.request("import", session.id, data)
+            except Exception:
+                try:
+                    target.request("close", session.id)
+                except RuntimeError:
+                    pass  # El destino no llegó a guardar la sesión
+                raise
+            with self.lock:
+                source.sessions.discard(session.id)
+                target.sessions.add(session.id)
+                session.worker = target
+            self.migrations += 1
+            source.request("release", session.id)
+
+    def rebalance(self):
+        """Mide la carga de cada worker, cierra sesiones inactivas y migra una sesión si hace falta."""
+        now = time.perf_counter()
+        elapsed = max(now - self.last_rebalance, 1e-6)
+        self.last_rebalance = now
+        with self.lock:
+            sessions = list(self.sessions.values())
+        session_loads = {}
+        loads = {worker: 0.0 for worker in self.workers}
+        for session in sessions:
+            session_loads[session] = session.busy / elapsed
+            session.busy = 0.0
+            loads[session.worker] += session_loads[session]
+        self.loads = loads
+
+        expired = time.time() - self.session_ttl
+        for session in sessions:
+            if session.last_seen < expired:
+                try:
+                    self.close(session.id)
+                except Exception as e:
+                    print(f"Error al cerrar la sesión inactiva {session.id}: {e}")
+
+        busiest = max(self.workers, key=lambda worker: loads[worker])
+        if len(self.workers) < 2 or loads[busiest] < self.overload or len(busiest.sessions) < 2:
+            return
+        target = self.least_loaded(exclude=busiest)
+        gap = loads[busiest] - loads[target]
+        # Mover la sesión que más acerca ambas cargas sin invertir el desbalance
+        candidates = [session for session in sessions if session.worker is busiest and session_loads[session] < gap]
+        if not candidates:
+            return
+        session = min(candidates, key=lambda session: abs(session_loads[session] - gap / 2))
+        self.migrate(session, target)
+        loads[busiest] -= session_loads[session]
+        loads[target] += session_loads[session]
+
+    def balance_loop(self):
+        """Rebalancea periódicamente hasta que se detenga el router."""
+        while not self.stopped.wait(self.interval):
+            try:
+                self.rebalance()
+            except Exception as e:
+                print(f"Error al rebalancear sesiones: {e}")
+
+    def status(self):
+        """Retorna sesiones y carga de cada worker."""
+        return {
+            "migrations": self.migrations,
+            "workers": [{
+                "index": worker.index,
+                "pid": worker.process.pid,
+                "alive": worker.process.is_alive(),
+                "sessions": len(worker.sessions),
+                "load": round(self.loads[worker], 3),
+            } for worker in self.workers],
+        }
+
+    def shutdown(self):
+        """Detiene el rebalanceo y los workers."""
+        self.stopped.set()
+        self.balancer.join()
+        for worker in self.workers:
+            worker.stop()
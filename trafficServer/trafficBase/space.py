@@ -0,0 +1,209 @@
+"""
+Reto - Movilidad Urbana
+Modelación de Sistemas Multiagentes con Gráficas Computacionales
+28/11/2024
+Francisco José Urquizo Schnaas A01028786
+Gabriel Edid Harari A01782146
+space.py
+"""
+
+CHUNK_BITS = 4  # Bloques de 16 x 16 celdas
+
+
+class ChunkedGrid:
+    """
+    Grid de múltiples agentes por celda que solo reserva memoria para los bloques ocupados.
+
+    El espacio se divide en bloques cuadrados de 2**chunk_bits celdas de lado. Un bloque se crea
+    al colocar el primer agente en alguna de sus celdas y se libera cuando queda vacío; cada
+    celda de un bloque guarda su lista de agentes solo cuando tiene alguno. Los mapas de ciudad
+    son sobre todo manzanas vacías, así que la memoria depende de las calles y agentes, no de
+    width * height. Ofrece las consultas de MultiGrid que usan los agentes y el modelo.
+    """
+
+    def __init__(self, width, height, torus=False, chunk_bits=CHUNK_BITS):
+        """
+        Inicializa el grid vacío.
+
+        Args:
+            width (int): Ancho en celdas.
+            height (int): Alto en celdas.
+            torus (bool): Si es True, los bordes se conectan (como en MultiGrid).
+            chunk_bits (int): Logaritmo base 2 del lado de cada bloque.
+        """
+        self.width = width
+        self.height = height
+        self.torus = torus
+        self.chunk_bits = chunk_bits
+        self.chunk_size = 1 << chunk_bits
+        self.chunk_mask = self.chunk_size - 1
+        self.chunk_cols = (width + self.chunk_mask) >> chunk_bits
+        self.chunks = {}  # Índice del bloque -> lista de celdas (None si la celda está vacía)
+        self.counts = {}  # Índice del bloque -> número de agentes en el bloque
+
+    def chunk_index(self, pos):
+        """Retorna el índice del bloque que contiene una celda."""
+        return (pos[1] >> self.chunk_bits) * self.chunk_cols + (pos[0] >> self.chunk_bits)
+
+    def cell_index(self, pos):
+        """Retorna la posición de una celda dentro de su bloque."""
+        return ((pos[1] & self.chunk_mask) << self.chunk_bits) | (pos[0] & self.chunk_mask)
+
+    def out_of_bounds(self, pos):
+        """Retorna True si la celda está fuera del grid."""
+        x, y = pos
+        return x < 0 or x >= self.width or y < 0 or y >= self.height
+
+    def torus_adj(self, pos):
+        """Ajusta una celda a los límites del grid si es un toro."""
+        if not self.out_of_bounds(pos):
+            return pos
+        if not self.torus:
+            raise Exception("Point out of bounds, and space non-toroidal.")
+        return pos[0] % self.width, pos[1] % self.height
+
+    def cell_contents(self, pos):
+        """Retorna la lista de agentes de una celda, o None si está vacía o fuera del grid."""
+        x, y = pos
+        if x < 0 or x >= self.width or y < 0 or y >= self.height:
+            return None
+        bits = self.chunk_bits
+        chunk = self.chunks.get((y >> bits) * self.chunk_cols + (x >> bits))
+        if chunk is None:
+            return None
+        mask = self.chunk_mask
+        return chunk[((y & mask) << bits) | (x & mask)]
+
+    def add_to_cell(self, pos, agent):
+        """Agrega un agente a la lista de una celda, creando el bloque si hace falta."""
+        key = self.chunk_index(pos)
+        chunk = self.chunks.get(key)
+        if chunk is None:
+            chunk = self.chunks[key] = [None] * (self.chunk_size * self.chunk_size)
+            self.counts[key] = 0
+        index = self.cell_index(pos)
+        if chunk[index] is None:
+            chunk[index] = [agent]
+        else:
+            chunk[index].append(agent)
+        self.counts[key] += 1
+
+    def remove_from_cell(self, pos, agent):
+        """Quita un agente de una celda y libera la celda y el bloque si quedan vacíos."""
+        key = self.chunk_index(pos)
+        chunk = self.chunks[key]
+        index = self.cell_index(pos)
+        contents = chunk[index]
+        contents.remove(agent)
+        if not contents:
+            chunk[index] = None
+        self.counts[key] -= 1
+        if self.counts[key] == 0:
+            del self.chunks[key]
+            del self.counts[key]
+
+    def place_agent(self, agent, pos):
+        """Coloca un agente en una celda y actualiza su posición."""
+        pos = self.torus_adj(pos)
+        self.add_to_cell(pos, agent)
+        agent.pos = pos
+
+    def remove_agent(self, agent):
+        """Retira un agente del grid."""
+        self.remove_from_cell(agent.pos, agent)
+        agent.pos = None
+
+    def move_agent(self, agent, pos):
+        """Mueve un agente de su celda actual a otra."""
+        pos = self.torus_adj(pos)
+        self.remove_from_cell(agent.pos, agent)
+        self.add_to_cell(pos, agent)
+        agent.pos = pos
+
+    def is_cell_empty(self, pos):
+        """Retorna True si la celda no tiene agentes."""
+        return not self.cell_contents(pos)
+
+    def get_cell_list_contents(self, cell_list):
+        """
+        Retorna los agentes de una lista de celdas (o de una sola celda).
+
+        Args:
+            cell_list (list): Celdas (x, y), o una sola celda.
+
+        Returns:
+            list: Agentes en esas celdas, en el orden de las celdas.
+        """
+        if len(cell_list) == 2 and not isinstance(cell_list[0], tuple):
+            cell_list = [cell_list]
+        agents = []
+        for pos in cell_list:
+            contents = self.cell_contents(pos)
+            if contents:
+                agents.extend(contents)
+        return agents
+
+    def iter_cell_list_contents(self, cell_list):
+        """Itera sobre los agentes de una lista de celdas."""
+        return iter(self.get_cell_list_contents(cell_list))
+
+    def get_neighborhood(self, pos, moore, include_center=False, radius=1):
+        """
+        Retorna las celdas vecinas de una celda, en el mismo orden que MultiGrid.
+
+        Args:
+            pos (tuple): Celda central.
+            moore (bool): Si es True incluye diagonales; si es False, vecindad de von Neumann.
+            include_center (bool): Si es True incluye la celda central.
+            radius (int): Radio de la vecindad en celdas.
+
+        Returns:
+            tuple: Celdas (x, y) de la vecindad dentro del grid.
+        """
+        if self.out_of_bounds(pos):
+            raise Exception("The `pos` tuple passed is out of bounds.")
+        x, y = pos
+        neighborhood = {}  # Diccionario para conservar el orden sin repetir celdas en un toro
+        for dx in range(-radius, radius + 1):
+            for dy in range(-radius, radius + 1):
+                if not moore and abs(dx) + abs(dy) > radius:
+                    continue
+                new_x, new_y = x + dx, y + dy
+                if self.torus:
+                    new_x %= self.width
+                    new_y %= self.height
+                elif new_x < 0 or new_x >= self.width or new_y < 0 or new_y >= self.height:
+                    continue
+                neighborhood[(new_x, new_y)] = True
+        if not include_center:
+            neighborhood.pop(pos, None)
+        return tuple(neighborhood)
+
+    def get_neighbors(self, pos, moore, include_center=False, radius=1):
+        """Retorna los agentes en la vecindad de una celda."""
+        return self.get_cell_list_contents(self.get_neighborhood(pos, moore, include_center, radius))
+
+    def coord_iter(self):
+        """
+        Itera sobre (contenido, (x, y)) de las celdas de los bloques reservados.
+
+        El orden es por columnas (x y luego y), como en MultiGrid; las celdas de bloques no
+        reservados están vacías y se omiten.
+        """
+        bits = self.chunk_bits
+        mask = self.chunk_mask
+        columns = {}  # Columna de bloques -> filas de bloques reservados
+        for key in self.chunks:
+            chunk_y, chunk_x = divmod(key, self.chunk_cols)
+            columns.setdefault(chunk_x, []).append(chunk_y)
+        for chunk_x in sorted(columns):
+            rows = sorted(columns[chunk_x])
+            for x in range(chunk_x << bits, min((chunk_x + 1) << bits, self.width)):
+                for chunk_y in rows:
+                    chunk = self.chunks[chunk_y * self.chunk_cols + chunk_x]
+                    for y in range(chunk_y << bits, min((chunk_y + 1) << bits, self.height)):
+                        yield chunk[((y & mask) << bits) | (x & mask)] or [], (x, y)
+
+    def get_chunk_count(self):
+        """Retorna el número de bloques reservados."""
+        return len(self.chunks)
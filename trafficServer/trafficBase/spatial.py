@@ -0,0 +1,228 @@
+"""
+Reto - Movilidad Urbana
+Modelación de Sistemas Multiagentes con Gráficas Computacionales
+28/11/2024
+Francisco José Urquizo Schnaas A01028786
+Gabriel Edid Harari A01782146
+spatial.py
+"""
+
+TILE_SIZE = 32  # Lado en celdas de las cubetas y de los tiles de la capa estática
+
+
+def in_box(x, z, box):
+    """Retorna True si la celda (x, z) está dentro de la caja (min_x, min_z, max_x, max_z), inclusiva."""
+    return box[0] <= x <= box[2] and box[1] <= z <= box[3]
+
+
+def tile_box(tx, tz, size=TILE_SIZE):
+    """Retorna la caja (inclusiva) que cubre el tile (tx, tz)."""
+    return (tx * size, tz * size, (tx + 1) * size - 1, (tz + 1) * size - 1)
+
+
+def tile_count(cells, size=TILE_SIZE):
+    """Retorna cuántos tiles de size celdas hacen falta para cubrir cells celdas."""
+    return -(-cells // size)
+
+
+def parse_viewport(args, width, height, size=TILE_SIZE):
+    """
+    Lee la caja o el tile pedidos en los parámetros de una petición.
+
+    Se acepta tile=tx,tz (tiles de size celdas, solo los que cubren la ciudad) o cualquiera de
+    minX, minZ, maxX y maxZ; los límites que falten se toman de los bordes de la ciudad.
+
+    Args:
+        args (dict): Parámetros de la petición.
+        width (int): Ancho de la ciudad en celdas.
+        height (int): Alto de la ciudad en celdas.
+        size (int): Lado de los tiles en celdas.
+
+    Returns:
+        tuple: (caja, tile), con tile = (tx, tz) o None; o None si no se pidió ninguna caja.
+
+    Raises:
+        ValueError: Si algún parámetro no es un entero válido o el tile está fuera de la ciudad.
+    """
+    tile = args.get('tile')
+    if tile is not None:
+        tx, tz = (int(value) for value in tile.split(','))
+        if not (0 <= tx < tile_count(width, size) and 0 <= tz < tile_count(height, size)):
+            raise ValueError(f"Tile fuera de la ciudad: {tile}")
+        return tile_box(tx, tz, size), (tx, tz)
+    keys = ('minX', 'minZ', 'maxX', 'maxZ')
+    if not any(key in args for key in keys):
+        return None
+    defaults = (0, 0, width - 1, height - 1)
+    box = tuple(int(args[key]) if key in args else default for key, default in zip(keys, defaults))
+    return box, None
+
+
+def viewport_response(key, rows, box, tile, size=TILE_SIZE):
+    """Retorna la respuesta de un endpoint consultado por caja o por tile."""
+    response = {key: rows, "bbox": {"minX": box[0], "minZ": box[1], "maxX": box[2], "maxZ": box[3]}}
+    if tile is not None:
+        response["tile"] = {"x": tile[0], "z": tile[1], "size": size}
+    return response
+
+
+class BucketIndex:
+    """
+    Índice espacial por cubetas cuadradas de size celdas de lado.
+
+    Cada cubeta guarda sus elementos en un diccionario (conjunto ordenado), así que agregar,
+    quitar o mover un elemento cuesta O(1) y mover dentro de la misma cubeta no cuesta nada.
+    Una consulta por caja solo visita las cubetas que la intersectan.
+    """
+
+    def __init__(self, size=TILE_SIZE):
+        """
+        Args:
+            size (int): Lado de cada cubeta en celdas.
+        """
+        self.size = size
+        self.buckets = {}  # (bx, bz) -> {elemento: posición}
+
+    def key(self, pos):
+        """Retorna la cubeta de una celda."""
+        return (pos[0] // self.size, pos[1] // self.size)
+
+    def add(self, item, pos):
+        """Agrega un elemento en una celda."""
+        self.buckets.setdefault(self.key(pos), {})[item] = pos
+
+    def remove(self, item, pos):
+        """Quita un elemento que estaba en una celda."""
+        key = self.key(pos)
+        bucket = self.buckets[key]
+        del bucket[item]
+        if not bucket:
+            del self.buckets[key]
+
+    def move(self, item, old_pos, new_pos):
+        """Actualiza la celda de un elemento."""
+        old_key, new_key = self.key(old_pos), self.key(new_pos)
+        if old_key == new_key:
+            self.buckets[old_key][item] = new_pos
+            return
+        self.remove(item, old_pos)
+        self.buckets.setdefault(new_key, {})[item] = new_pos
+
+    def query(self, box):
+        """
+        Retorna los elementos dentro de una caja.
+
+        Args:
+            box (tuple): (min_x, min_z, max_x, max_z), inclusiva.
+
+        Returns:
+            list: Elementos en la caja, agrupados por cubeta.
+        """
+        min_bx, min_bz = self.key((box[0], box[1]))
+        max_bx, max_bz = self.key((box[2], box[3]))
+        if max_bx < min_bx or max_bz < min_bz:
+            return []
+        if (max_bx - min_bx + 1) * (max_bz - min_bz + 1) > len(self.buckets):
+            # La caja cubre más cubetas de las que existen: recorrer solo las existentes
+            keys = sorted(key for key in self.buckets
+                          if min_bx <= key[0] <= max_bx and min_bz <= key[1] <= max_bz)
+        else:
+            keys = [(bx, bz) for bx in range(min_bx, max_bx + 1) for bz in range(min_bz, max_bz + 1)]
+        items = []
+        for key in keys:
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                continue
+            # Las cubetas interiores están completas; solo las del borde se filtran
+            inner = (min_bx < key[0] < max_bx) and (min_bz < key[1] < max_bz)
+            if inner:
+                items.extend(bucket)
+            else:
+                items.extend(item for item, pos in bucket.items() if in_box(pos[0], pos[1], box))
+        return items
+
+
+def static_row(agent):
+    """Retorna la representación de un agente estático en el formato de los endpoints."""
+    row = {"id": str(agent.unique_id), "x": agent.pos[0], "y": 1, "z": agent.pos[1]}
+    direction = getattr(agent, "direction", None)
+    if direction is not None:
+        row["direction"] = direction
+    return row
+
+
+class RowIndex:
+    """
+    Índice espacial de filas ya armadas (diccionarios con x y z).
+
+    Sirve para capas que llegan como filas en lugar de agentes: la capa estática y los frames de
+    una sesión del servidor con workers o de una traza. Se construye una sola vez por capa; las
+    consultas solo visitan las cubetas que intersectan la caja y las respuestas por tile se
+    guardan ya armadas (solo las de tiles que cubren la ciudad).
+    """
+
+    def __init__(self, rows, width, height, size=TILE_SIZE):
+        """
+        Args:
+            rows (list): Filas con llaves x y z.
+            width, height (int): Tamaño de la ciudad en celdas.
+            size (int): Lado de las cubetas y tiles en celdas.
+        """
+        self.rows = rows
+        self.size = size
+        self.tiles_x = tile_count(width, size)
+        self.tiles_z = tile_count(height, size)
+        self.index = BucketIndex(size)
+        for i, row in enumerate(rows):
+            self.index.add(i, (row["x"], row["z"]))
+        self.tiles = {}  # (tx, tz) -> filas del tile
+
+    def query(self, box):
+        """Retorna las filas dentro de una caja."""
+        rows = self.rows
+        return [rows[i] for i in self.index.query(box)]
+
+    def tile(self, tx, tz):
+        """Retorna las filas de un tile (se guardan tras la primera consulta)."""
+        if not (0 <= tx < self.tiles_x and 0 <= tz < self.tiles_z):
+            return []  # Fuera de la ciudad: no hay filas y no se guarda en el caché
+        rows = self.tiles.get((tx, tz))
+        if rows is None:
+            rows = self.tiles[(tx, tz)] = self.query(tile_box(tx, tz, self.size))
+        return rows
+
+    def view(self, view):
+        """Retorna las filas de una vista (caja, tile) de parse_viewport."""
+        box, tile = view
+        return self.tile(*tile) if tile is not None else self.query(box)
+
+
+class StaticIndex:
+    """
+    Índice espacial de la capa estática (calles, obstáculos y destinos) de un modelo.
+
+    Se construye una sola vez por modelo, con un RowIndex por tipo de agente, porque la capa
+    estática no cambia durante la simulación.
+    """
+
+    KINDS = ("roads", "obstacles", "destinations")
+
+    def __init__(self, model, size=TILE_SIZE):
+        """
+        Args:
+            model (CityModel): Modelo con la capa estática ya colocada.
+            size (int): Lado de las cubetas y tiles en celdas.
+        """
+        self.indexes = {
+            kind: RowIndex([static_row(agent) for agent in getattr(model, kind) if agent.pos is not None],
+                           model.width, model.height, size)
+            for kind in self.KINDS
+        }
+
+    def query(self, kind, box):
+        """Retorna las filas de un tipo de agente estático dentro de una caja."""
+        return self.indexes[kind].query(box)
+
+    def tile(self, kind, tx, tz):
+        """Retorna las filas de un tile de la capa estática (se guardan tras la primera consulta)."""
+        return self.indexes[kind].tile(tx, tz)
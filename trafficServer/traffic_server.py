@@ -5,19 +5,30 @@
 # Gabriel Edid Harari A01782146
 # traffic_server.py
 
+import argparse
 from flask import Flask, request, jsonify, send_from_directory
 from flask_cors import CORS
 
 # Importar el modelo y agentes desde el paquete trafficBase
 from trafficBase.model import CityModel
 from trafficBase.agent import Road, Traffic_Light, Obstacle, Destination, Car
+from trafficBase.recorder import TracePlayer
+from trafficBase.analytics import heatmap_encoding
+from trafficBase.pool import ModelPool, model_config, update_options
+from trafficBase.spatial import TILE_SIZE, RowIndex, parse_viewport, viewport_response
 
 # Inicializar variables globales
 number_agents = 10
 N = number_agents  # Definir N como variable global
 randomModel = None
+replayPlayer = None  # Reproductor de traza activo (modo replay, sin CityModel)
+replayIndexes = {}  # Tipo de la capa estática de la traza -> RowIndex
+replayAgents = (None, None)  # (paso, RowIndex de los coches) del último frame consultado por caja
 currentStep = 0
 
+# Pool de modelos precalentados; /init entrega uno en lugar de construirlo en la petición
+modelPool = ModelPool(CityModel, size=2)
+
 # Inicializar la aplicación Flask
 app = Flask(__name__, static_folder='static')
 CORS(app)
@@ -27,20 +38,102 @@ CORS(app)
 def serve_static(filename):
     return send_from_directory(app.static_folder, filename)
 
+def startReplay(path, speed=1.0, step=None):
+    """Abre una traza grabada y cambia el servidor a modo replay."""
+    global randomModel, replayPlayer, replayIndexes, replayAgents, currentStep
+    player = TracePlayer(path, speed=speed, step=step)
+    if replayPlayer is not None:
+        replayPlayer.close()
+    randomModel = None
+    replayPlayer = player
+    # La capa estática de la traza se indexa una sola vez
+    replayIndexes = {
+        kind: RowIndex(getattr(player, kind), player.width, player.height)
+        for kind in ("roads", "obstacles", "destinations")
+    }
+    replayAgents = (None, None)
+    currentStep = player.step
+    print(f"Reproduciendo traza {path} desde el paso {currentStep} ({len(player.reader)} pasos grabados)")
+    return player
+
+def requestViewport():
+    """
+    Retorna la caja o el tile pedidos con minX/minZ/maxX/maxZ o tile=tx,tz.
+
+    Returns:
+        tuple: (caja, tile) o None si la petición pide toda la ciudad.
+
+    Raises:
+        ValueError: Si los parámetros no son enteros válidos.
+    """
+    source = replayPlayer if replayPlayer is not None else randomModel
+    return parse_viewport(request.args, source.width, source.height)
+
+def invalidViewport(e):
+    """Respuesta para parámetros de caja o tile inválidos."""
+    return jsonify({"message": "Caja o tile inválido.", "error": str(e)}), 400
+
+def replayAgentIndex():
+    """Retorna el índice de los coches del frame actual de la traza, construyéndolo una vez por frame."""
+    global replayAgents
+    step = replayPlayer.step
+    if replayAgents[0] != step:
+        replayAgents = (step, RowIndex(replayPlayer.agent_positions(), replayPlayer.width, replayPlayer.height))
+    return replayAgents[1]
+
+def staticViewport(kind, view):
+    """Respuesta de la capa estática (roads, obstacles o destinations) limitada a una caja o tile."""
+    box, tile = view
+    if replayPlayer is not None:
+        rows = replayIndexes[kind].view(view)
+    else:
+        index = randomModel.get_static_index()
+        rows = index.tile(kind, *tile) if tile is not None else index.query(kind, box)
+    return jsonify(viewport_response('positions', rows, box, tile)), 200
+
 # Endpoint para inicializar el modelo
 @app.route('/init', methods=['POST'])
 def initModel():
-    global randomModel, number_agents, N  # Incluir N en la declaración global
+    global randomModel, replayPlayer, replayIndexes, replayAgents, currentStep, number_agents, N  # Incluir N en la declaración global
     if request.method == 'POST':
         try:
             data = request.get_json()
             number_agents = int(data.get('NAgents', 10))
             N = number_agents  # Actualizar la variable global N
-            
+
+            # Modo replay: servir la simulación desde una traza grabada sin instanciar CityModel
+            if data.get('trace'):
+                step = data.get('step')
+                speed = float(data.get('speed', 1.0))
+                step = int(step) if step is not None else None
+                try:
+                    player = startReplay(data['trace'], speed, step)
+                except (OSError, ValueError, KeyError) as e:
+                    # Directorio inexistente, archivos faltantes o meta.json corrupto
+                    return jsonify({"message": "No se pudo abrir la traza.", "error": str(e)}), 400
+                return jsonify({
+                    "message": "Traza cargada, modo replay iniciado.",
+                    "number_agents": number_agents,
+                    "car_agents": player.agent_positions(),
+                    "obstacle_agents": player.obstacles,
+                    "width": player.width,
+                    "height": player.height,
+                    "tileSize": TILE_SIZE,
+                    "currentStep": currentStep
+                }), 200
+
+            config = model_config(data)  # Validar antes de salir del modo replay
+
+            if replayPlayer is not None:
+                replayPlayer.close()
+                replayPlayer = None
+                replayIndexes, replayAgents = {}, (None, None)
+                currentStep = 0  # El paso de la traza no aplica al modelo nuevo
+
             print(f"Iniciando CityModel con N={N}")  # Log para depuración
             
-            # Instanciar CityModel sin argumentos posicionales
-            randomModel = CityModel()
+            # Tomar un CityModel precalentado con la configuración pedida
+            randomModel = modelPool.acquire(**config)
 
             num_obstacles = len(randomModel.obstacles)
             print(f"Modelo inicializado con {len(randomModel.cars)} coches y {num_obstacles} obstáculos.")
@@ -71,19 +164,66 @@ def initModel():
                 "car_agents": car_agents,
                 "obstacle_agents": obstacle_agents,
                 "width": randomModel.grid.width,
-                "height": randomModel.grid.height
+                "height": randomModel.grid.height,
+                "tileSize": TILE_SIZE
             }), 200
+        except ValueError as e:
+            return jsonify({"message": "Parámetros de /init inválidos.", "error": str(e)}), 400
         except Exception as e:
             print(f"Error al inicializar el modelo: {e}")
             return jsonify({"message": "Error al inicializar el modelo.", "error": str(e)}), 500
 
+# Endpoint para controlar la reproducción: saltar a un paso y/o cambiar la velocidad
+@app.route('/replay', methods=['POST'])
+def controlReplay():
+    global replayPlayer, currentStep
+    if replayPlayer is None:
+        return jsonify({"message": "No hay traza en reproducción."}), 400
+    try:
+        data = request.get_json()
+        if 'speed' in data:
+            replayPlayer.speed = float(data['speed'])
+        if 'step' in data:
+            replayPlayer.seek(int(data['step']))
+        currentStep = replayPlayer.step
+        response = {
+            "currentStep": currentStep,
+            "speed": replayPlayer.speed,
+            "firstStep": replayPlayer.reader.steps[0],
+            "lastStep": replayPlayer.reader.steps[-1],
+            "finished": replayPlayer.finished
+        }
+        if data.get('returnState', False):
+            response["state"] = replayPlayer.snapshot()
+        return jsonify(response), 200
+    except Exception as e:
+        print(f"Error al controlar la reproducción: {e}")
+        return jsonify({"message": "Error al controlar la reproducción.", "error": str(e)}), 500
+
 # Endpoint para obtener posiciones de los agentes Car
 @app.route('/getAgents', methods=['GET'])
 def getAgents():
     global randomModel
-    if randomModel is None:
+    if replayPlayer is None and randomModel is None:
         return jsonify({"message": "Modelo no inicializado."}), 400
     try:
+        view = requestViewport()
+    except ValueError as e:
+        return invalidViewport(e)
+    if replayPlayer is not None:
+        if view is not None:
+            return jsonify(viewport_response('positions', replayAgentIndex().view(view), *view)), 200
+        return jsonify({'positions': replayPlayer.agent_positions()}), 200
+    try:
+        if view is not None:
+            # Solo los coches de las cubetas que intersectan la caja
+            agentPositions = [{
+                "id": str(car.unique_id),
+                "x": car.pos[0],
+                "y": 1,
+                "z": car.pos[1]
+            } for car in randomModel.cars_in_box(view[0])]
+            return jsonify(viewport_response('positions', agentPositions, *view)), 200
         agentPositions = [{
             "id": str(car.unique_id),
             "x": car.pos[0],
@@ -99,8 +239,16 @@ def getAgents():
 @app.route('/getObstacles', methods=['GET'])
 def getObstacles():
     global randomModel
-    if randomModel is None:
+    if replayPlayer is None and randomModel is None:
         return jsonify({"message": "Modelo no inicializado."}), 400
+    try:
+        view = requestViewport()
+    except ValueError as e:
+        return invalidViewport(e)
+    if view is not None:
+        return staticViewport('obstacles', view)
+    if replayPlayer is not None:
+        return jsonify({'positions': replayPlayer.obstacles}), 200
     try:
         obstaclePositions = [{
             "id": str(obstacle.unique_id),
@@ -122,11 +270,40 @@ def getObstacles():
 @app.route('/update', methods=['POST'])
 def updateModel():
     global randomModel, currentStep
-    if randomModel is None:
+    if replayPlayer is None and randomModel is None:
         return jsonify({"message": "Modelo no inicializado."}), 400
     try:
-        data = request.get_json()
-        steps = int(data.get('steps', 1))
+        data = request.get_json() or {}
+        try:
+            options = update_options(data)
+        except ValueError as e:
+            return jsonify({"message": "Parámetros de /update inválidos.", "error": str(e)}), 400
+        steps = options["steps"]
+
+        # Modo replay: avanzar la reproducción a su velocidad actual
+        if replayPlayer is not None:
+            currentStep = replayPlayer.advance(steps)
+            response = {"currentStep": currentStep, "finished": replayPlayer.finished}
+            if data.get('returnState', False):
+                response["state"] = replayPlayer.snapshot()
+            return jsonify(response), 200
+
+        # Modo rápido: avanzar sin mensajes por agente, con recopilación diezmada y
+        # opcionalmente regresar snapshots cada frameEvery pasos y/o el estado final
+        if options["fastForward"]:
+            frames = randomModel.run_steps(
+                steps,
+                collect_every=options["collectEvery"],
+                frame_every=options["frameEvery"]
+            )
+            currentStep += steps
+            response = {"currentStep": currentStep}
+            if options["frameEvery"]:
+                response["frames"] = frames
+            if data.get('returnState', False):
+                response["state"] = randomModel.snapshot()
+            return jsonify(response), 200
+
         for _ in range(steps):
             randomModel.step()
             currentStep += 1
@@ -139,6 +316,8 @@ def updateModel():
 @app.route('/getTrafficLights', methods=['GET'])
 def getTrafficLights():
     global randomModel
+    if replayPlayer is not None:
+        return jsonify({'trafficLights': replayPlayer.traffic_lights()}), 200
     if randomModel is None:
         return jsonify({"message": "Modelo no inicializado."}), 400
     try:
@@ -159,8 +338,16 @@ def getTrafficLights():
 @app.route('/getDestinations', methods=['GET'])
 def getDestinations():
     global randomModel
-    if randomModel is None:
+    if replayPlayer is None and randomModel is None:
         return jsonify({"message": "Modelo no inicializado."}), 400
+    try:
+        view = requestViewport()
+    except ValueError as e:
+        return invalidViewport(e)
+    if view is not None:
+        return staticViewport('destinations', view)
+    if replayPlayer is not None:
+        return jsonify({'positions': replayPlayer.destinations}), 200
     try:
         destinationPositions = [{
             "id": str(destination.unique_id),
@@ -182,8 +369,16 @@ def getDestinations():
 @app.route('/getRoads', methods=['GET'])
 def getRoads():
     global randomModel
-    if randomModel is None:
+    if replayPlayer is None and randomModel is None:
         return jsonify({"message": "Modelo no inicializado."}), 400
+    try:
+        view = requestViewport()
+    except ValueError as e:
+        return invalidViewport(e)
+    if view is not None:
+        return staticViewport('roads', view)
+    if replayPlayer is not None:
+        return jsonify({'positions': replayPlayer.roads}), 200
     try:
         roadPositions = []
         for road in randomModel.roads:  # Asegúrate de usar 'roads' (plural)
@@ -206,7 +401,41 @@ def getRoads():
         print(f"Error al recuperar los caminos: {e}")
         return jsonify({'message': 'Error al recuperar los caminos.', 'error': str(e)}), 500
     
+# Endpoint para obtener las métricas de congestión acumuladas (mapas de calor)
+@app.route('/heatmap', methods=['GET'])
+def getHeatmap():
+    global randomModel
+    if randomModel is None:
+        return jsonify({"message": "Modelo no inicializado."}), 400
+    try:
+        encoding = heatmap_encoding(request.args.get('encoding', 'list'))
+    except ValueError as e:
+        return jsonify({"message": "Codificación de /heatmap inválida.", "error": str(e)}), 400
+    try:
+        payload = randomModel.heatmap_payload(encoding)
+        if payload is None:
+            return jsonify({"message": "Las métricas de congestión están desactivadas."}), 400
+        return jsonify(payload), 200
+    except Exception as e:
+        print(f"Error al recuperar las métricas de congestión: {e}")
+        return jsonify({'message': 'Error al recuperar las métricas de congestión.', 'error': str(e)}), 500
+
 
 if __name__ == '__main__':
-    # Ejecutar el servidor Flask en el puerto 8585
-    app.run(host="0.0.0.0", port=8585, debug=True, use_reloader=False)
+    parser = argparse.ArgumentParser(description="Servidor de la simulación de movilidad urbana")
+    parser.add_argument('--replay', help="Directorio de una traza grabada para servir en modo replay")
+    parser.add_argument('--speed', type=float, default=1.0, help="Velocidad de reproducción de la traza")
+    parser.add_argument('--port', type=int, default=8585, help="Puerto del servidor")
+    parser.add_argument('--pool-size', type=int, default=2, help="Modelos precalentados por configuración")
+    args = parser.parse_args()
+    modelPool.size = args.pool_size
+    if args.replay:
+        try:
+            startReplay(args.replay, args.speed)  # En modo replay no se construye ningún CityModel
+        except (OSError, ValueError, KeyError) as e:
+            parser.error(f"No se pudo abrir la traza {args.replay}: {e}")
+    else:
+        modelPool.warm()  # Precalentar la configuración por defecto
+
+    # Ejecutar el servidor Flask (por defecto en el puerto 8585)
+    app.run(host="0.0.0.0", port=args.port, debug=True, use_reloader=False)